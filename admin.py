@@ -1,11 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from app import db, Project, Category, User, Ticket, socketio
+from app import db, Project, Category, User, Ticket, socketio, category_cache, dashboard_stats, presence, response_cache, analytics
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime, timedelta
 import json
-from collections import defaultdict
 
 admin = Blueprint('admin', __name__)
 
@@ -17,40 +16,14 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Analytics and Logging
-class Analytics:
-    def __init__(self):
-        self.online_users = set()
-        self.user_actions = []
-        self.chat_messages = []
-        self.voice_sessions = []
-        self.downloads = []
-        
-    def log_user_action(self, user_id, action, details):
-        self.user_actions.append({
-            'user_id': user_id,
-            'action': action,
-            'details': details,
-            'timestamp': datetime.utcnow()
-        })
-        
-    def get_user_stats(self, user_id):
-        return {
-            'messages': len([m for m in self.chat_messages if m['user_id'] == user_id]),
-            'voice_time': sum(s['duration'] for s in self.voice_sessions if s['user_id'] == user_id),
-            'downloads': len([d for d in self.downloads if d['user_id'] == user_id])
-        }
-        
-    def get_system_stats(self):
-        return {
-            'total_users': User.query.count(),
-            'online_users': len(self.online_users),
-            'total_projects': Project.query.count(),
-            'total_downloads': len(self.downloads),
-            'active_voice_rooms': len(set(s['room'] for s in self.voice_sessions if s['end_time'] is None))
-        }
-
-analytics = Analytics()
+def get_system_stats():
+    return {
+        'total_users': User.query.count(),
+        'online_users': len(presence.users()),
+        'total_projects': Project.query.count(),
+        'total_downloads': analytics.total('download'),
+        'active_voice_rooms': analytics.voice.active_rooms()
+    }
 
 # User Management
 @admin.route('/admin/users')
@@ -122,6 +95,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    dashboard_stats.user_deleted(user_id)
     analytics.log_user_action(current_user.id, 'delete_user', {'deleted_user_id': user_id})
     socketio.emit('user_deleted', {'user_id': user_id}, broadcast=True)
     flash(f'User {username} has been deleted')
@@ -132,8 +106,8 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def admin_dashboard():
-    system_stats = analytics.get_system_stats()
-    recent_actions = analytics.user_actions[-50:]  # Last 50 actions
+    system_stats = get_system_stats()
+    recent_actions = analytics.recent_actions(50)  # Last 50 actions
     return render_template('admin/dashboard.html',
                          system_stats=system_stats,
                          recent_actions=recent_actions)
@@ -147,28 +121,24 @@ def analytics_dashboard():
     last_24h = now - timedelta(days=1)
     last_7d = now - timedelta(days=7)
     
-    # User activity
-    daily_users = defaultdict(int)
-    for action in analytics.user_actions:
-        if action['timestamp'] > last_7d:
-            daily_users[action['timestamp'].date()] += 1
-    
-    # Project downloads
-    daily_downloads = defaultdict(int)
-    for download in analytics.downloads:
-        if download['timestamp'] > last_7d:
-            daily_downloads[download['timestamp'].date()] += 1
+    # Daily series read straight from the day buckets
+    daily_users = {day.date(): count for day, count in
+                   analytics.series('action', 'day', last_7d, now) if count}
+    daily_downloads = {day.date(): count for day, count in
+                       analytics.series('download', 'day', last_7d, now) if count}
     
     # Voice room usage
     voice_stats = {
-        'total_sessions': len(analytics.voice_sessions),
-        'active_rooms': len(set(s['room'] for s in analytics.voice_sessions if s['end_time'] is None)),
-        'total_duration': sum(s['duration'] for s in analytics.voice_sessions)
+        'total_sessions': analytics.total('voice_session'),
+        'active_rooms': analytics.voice.active_rooms(),
+        'total_duration': analytics.total('voice_time')
     }
+    voice_stats['avg_session_duration'] = (voice_stats['total_duration'] / voice_stats['total_sessions']
+                                           if voice_stats['total_sessions'] else 0)
     
     return render_template('admin/analytics.html',
-                         daily_users=dict(daily_users),
-                         daily_downloads=dict(daily_downloads),
+                         daily_users=daily_users,
+                         daily_downloads=daily_downloads,
                          voice_stats=voice_stats)
 
 # Logs
@@ -176,60 +146,9 @@ def analytics_dashboard():
 @login_required
 @admin_required
 def view_logs():
-    logs = analytics.user_actions
+    logs = list(analytics.user_actions)
     return render_template('admin/logs.html', logs=logs)
 
-# Socket.IO events for analytics
-@socketio.on('connect')
-def handle_connect():
-    if current_user.is_authenticated:
-        analytics.online_users.add(current_user.id)
-        analytics.log_user_action(current_user.id, 'connect', {})
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    if current_user.is_authenticated:
-        analytics.online_users.discard(current_user.id)
-        analytics.log_user_action(current_user.id, 'disconnect', {})
-
-@socketio.on('message')
-def handle_message(data):
-    if current_user.is_authenticated:
-        analytics.chat_messages.append({
-            'user_id': current_user.id,
-            'message': data['message'],
-            'timestamp': datetime.utcnow()
-        })
-
-@socketio.on('join_voice')
-def handle_join_voice(data):
-    if current_user.is_authenticated:
-        analytics.voice_sessions.append({
-            'user_id': current_user.id,
-            'room': data['room'],
-            'start_time': datetime.utcnow(),
-            'end_time': None,
-            'duration': 0
-        })
-
-@socketio.on('leave_voice')
-def handle_leave_voice(data):
-    if current_user.is_authenticated:
-        for session in analytics.voice_sessions:
-            if session['user_id'] == current_user.id and session['end_time'] is None:
-                session['end_time'] = datetime.utcnow()
-                session['duration'] = (session['end_time'] - session['start_time']).total_seconds()
-                break
-
-@socketio.on('download_project')
-def handle_download(data):
-    if current_user.is_authenticated:
-        analytics.downloads.append({
-            'user_id': current_user.id,
-            'project_id': data['project_id'],
-            'timestamp': datetime.utcnow()
-        })
-
 # Project Management
 @admin.route('/admin/projects')
 @login_required
@@ -267,6 +186,9 @@ def add_project():
         
         db.session.add(project)
         db.session.commit()
+        category_cache.clear()
+        response_cache.invalidate('projects')
+        dashboard_stats.project_created()
         
         flash('Project added successfully')
         return redirect(url_for('admin.manage_projects'))
@@ -293,6 +215,8 @@ def edit_project(project_id):
             project.thumbnail = f'uploads/projects/{filename}'
             
         db.session.commit()
+        category_cache.clear()
+        response_cache.invalidate('projects')
         flash('Project updated successfully')
         return redirect(url_for('admin.manage_projects'))
         
@@ -306,6 +230,9 @@ def delete_project(project_id):
     project = Project.query.get_or_404(project_id)
     db.session.delete(project)
     db.session.commit()
+    category_cache.clear()
+    response_cache.invalidate('projects')
+    dashboard_stats.project_deleted()
     flash('Project deleted successfully')
     return redirect(url_for('admin.manage_projects'))
 
@@ -325,6 +252,8 @@ def add_category():
     category = Category(name=name)
     db.session.add(category)
     db.session.commit()
+    category_cache.clear()
+    response_cache.invalidate('projects')
     flash('Category added successfully')
     return redirect(url_for('admin.manage_categories'))
 
@@ -335,6 +264,8 @@ def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     db.session.delete(category)
     db.session.commit()
+    category_cache.clear()
+    response_cache.invalidate('projects')
     flash('Category deleted successfully')
     return redirect(url_for('admin.manage_categories'))
 
@@ -355,5 +286,6 @@ def change_ticket_status(ticket_id):
     if new_status in ['open', 'in_progress', 'closed']:
         ticket.status = new_status
         db.session.commit()
+        response_cache.invalidate('tickets')
         flash(f'Ticket status changed to {new_status}')
     return redirect(url_for('admin.manage_tickets')) 
\ No newline at end of file
@@ -0,0 +1,90 @@
+from collections import deque
+from datetime import datetime
+from eventstore import TimeBuckets
+from presence import VoicePresence
+
+
+# Raw events are kept only in fixed-size ring buffers (oldest events fall
+# out first); everything the dashboards chart or total comes from the
+# time-bucketed counters, so memory stays bounded and queries cost
+# O(buckets queried) instead of O(all history). With a sink, events are
+# also persisted in bulk and totals/series are read from the shared rollups.
+class Analytics:
+    def __init__(self, buffer_size=1000, sink=None):
+        self.user_actions = deque(maxlen=buffer_size)
+        self.chat_messages = deque(maxlen=buffer_size)
+        self.voice_sessions = deque(maxlen=buffer_size)
+        self.downloads = deque(maxlen=buffer_size)
+        self.counters = TimeBuckets()
+        self.voice = VoicePresence()
+        self.sink = sink
+
+    def _record(self, kind, timestamp, amount=1, user_id=None, room=None, details=None):
+        self.counters.add(kind, timestamp, amount, user_id=user_id, room=room)
+        if self.sink is not None:
+            self.sink.enqueue({
+                'kind': kind,
+                'user_id': user_id,
+                'room': room,
+                'amount': amount,
+                'details': details,
+                'timestamp': timestamp
+            })
+
+    def total(self, kind, user_id=None, room=None):
+        source = self.sink if self.sink is not None else self.counters
+        return source.total(kind, user_id=user_id, room=room)
+
+    def series(self, kind, granularity, since, until, user_id=None, room=None):
+        source = self.sink if self.sink is not None else self.counters
+        return source.series(kind, granularity, since, until, user_id=user_id, room=room)
+
+    def log_user_action(self, user_id, action, details):
+        now = datetime.utcnow()
+        self.user_actions.append({
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'timestamp': now
+        })
+        self._record('action', now, user_id=user_id, details={'action': action})
+
+    def log_chat_message(self, user_id, message, room=None):
+        now = datetime.utcnow()
+        self.chat_messages.append({
+            'user_id': user_id,
+            'message': message,
+            'timestamp': now
+        })
+        self._record('message', now, user_id=user_id, room=room)
+
+    def log_voice_join(self, user_id, room):
+        session = self.voice.join(user_id, room)
+        if session is None:
+            return
+        self.voice_sessions.append(session)
+        self._record('voice_session', session['start_time'], user_id=user_id, room=room)
+
+    def log_voice_leave(self, user_id, room=None):
+        for session in self.voice.leave(user_id, room):
+            self._record('voice_time', session['end_time'], session['duration'],
+                         user_id=user_id, room=session['room'])
+
+    def log_download(self, user_id, project_id):
+        now = datetime.utcnow()
+        self.downloads.append({
+            'user_id': user_id,
+            'project_id': project_id,
+            'timestamp': now
+        })
+        self._record('download', now, user_id=user_id, details={'project_id': project_id})
+
+    def recent_actions(self, limit=50):
+        return list(self.user_actions)[-limit:]
+
+    def get_user_stats(self, user_id):
+        return {
+            'messages': self.total('message', user_id=user_id),
+            'voice_time': self.total('voice_time', user_id=user_id),
+            'downloads': self.total('download', user_id=user_id)
+        }
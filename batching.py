@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+# Bounded write-behind queue. Callers hand documents to enqueue(); a
+# background worker passes them to write_batch() once batch_size documents
+# are waiting or flush_interval seconds have passed. A failed batch is
+# retried up to max_attempts times, retry_delay seconds apart and doubling,
+# before it is dropped and counted in `failed`. Subclasses implement
+# write_batch, which must be safe to repeat for documents it already wrote.
+class BatchWriter:
+    name = 'batch-writer'
+
+    def __init__(self, batch_size=100, flush_interval=0.5, max_queue=10000, put_timeout=1.0,
+                 max_attempts=3, retry_delay=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.backpressured = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def enqueue(self, doc):
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put(doc, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the writer is behind, so the caller pays for a
+            # synchronous flush before its document is accepted.
+            self.backpressured += 1
+            self.flush()
+            self._queue.put(doc)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _take_batch(self, block):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.write_batch(batch)
+                self.written += len(batch)
+                return
+            except Exception:
+                # Never let one bad batch kill the background writer
+                if attempt == self.max_attempts:
+                    self.failed += len(batch)
+                    log.exception('%s: failed to persist %d documents after %d attempts',
+                                  self.name, len(batch), attempt)
+                    return
+                self.retried += 1
+                log.warning('%s: attempt %d to persist %d documents failed, retrying',
+                            self.name, attempt, len(batch), exc_info=True)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch(block=False)
+                if not batch:
+                    break
+                self._write(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take_batch(block=True)
+            with self._flush_lock:
+                self._write(batch)
+
+    def stop(self, timeout=5.0):
+        # Drain on shutdown so queued messages are not lost.
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def register_shutdown(self):
+        atexit.register(self.stop)
@@ -0,0 +1,420 @@
+"""Load test with concurrent HTTP users and Socket.IO clients.
+
+Starts app.py in-process on a free localhost port, backed by a local mongod
+(--mongo mongodb://localhost:27017/codecord_bench) or an in-memory mongomock
+database (--mongo mongomock, the default), seeds users, projects and tickets,
+then runs for --duration seconds:
+
+  - --http-users sessions that log in and cycle through /projects and
+    /tickets; --admin-users of them also load /admin/dashboard;
+  - --chat-clients Socket.IO clients that each send --message-rate chat
+    messages per second and time the broadcast of their own message;
+  - --voice-clients Socket.IO clients that join and leave voice rooms and
+    time the server's acknowledgement of each.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/load_test.py [--mongo mongomock] [--duration 30] [--output results.json]
+
+With --url the clients target a server that is already running (for example
+gunicorn with MONGO_URI set to the same mongod), which keeps the load
+generator from competing with the server for the GIL. The server's rate
+limits must then be raised by its own environment.
+
+Repeat --url to spread the clients over several workers that share a
+Socket.IO message queue; every chat message must then also reach the chat
+clients on the other workers, timed as "chat_cross_worker" (undelivered
+copies count as its errors). For example, with the ZeroMQ broker:
+
+    python broker.py &
+    export SOCKETIO_MESSAGE_QUEUE=zmq+tcp://127.0.0.1:5555+5556 MONGO_URI=mongodb://localhost/codecord_bench
+    PORT=8001 python app.py & PORT=8002 python app.py &
+    python benchmarks/load_test.py --mongo $MONGO_URI --url http://127.0.0.1:8001 --url http://127.0.0.1:8002
+
+Prints one JSON document with, per operation, the count, errors, error
+rate, throughput and p50/p95/p99/max latency in milliseconds, so runs can be
+diffed. Operations whose error rate is above --max-error-rate are listed in
+"failed_operations" and the script exits with status 1: their latencies
+describe error paths and must not be compared with another run.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'bench-password'
+DATABASE = 'codecord_bench'
+UNLIMITED_RATE = '1000000,1000000'
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Latencies (seconds) and error counts per operation, shared by all clients.
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.statuses = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def add(self, op, seconds, status=None):
+        with self._lock:
+            self.latencies[op].append(seconds)
+            if status is not None:
+                self.statuses[op][status] += 1
+
+    def error(self, op, count=1, status=None):
+        with self._lock:
+            self.errors[op] += count
+            if status is not None:
+                self.statuses[op][status] += count
+
+    def summary(self, duration):
+        with self._lock:
+            ops = sorted(set(self.latencies) | set(self.errors))
+            return {op: {
+                'count': len(self.latencies[op]),
+                'errors': self.errors[op],
+                'error_rate': round(self.errors[op] / (len(self.latencies[op]) + self.errors[op]), 4),
+                'per_second': round(len(self.latencies[op]) / duration, 1),
+                'latency_ms': {
+                    'p50': round(percentile(self.latencies[op], 50) * 1000, 2),
+                    'p95': round(percentile(self.latencies[op], 95) * 1000, 2),
+                    'p99': round(percentile(self.latencies[op], 99) * 1000, 2),
+                    'max': round(max(self.latencies[op], default=0.0) * 1000, 2),
+                },
+                'statuses': dict(self.statuses[op]),
+            } for op in ops}
+
+
+# Chat fan-out across workers. Every chat client is in the default channel,
+# so each message must reach every chat client that was connected to another
+# worker when it was sent.
+class CrossWorker:
+    def __init__(self):
+        self.sent = {}  # token -> (send time, worker index)
+        self.receivers = []  # [connect time, worker index, tokens received]
+        self._lock = threading.Lock()
+
+    def connected(self, worker):
+        receiver = [time.perf_counter(), worker, set()]
+        with self._lock:
+            self.receivers.append(receiver)
+        return receiver
+
+    def send(self, token, worker):
+        with self._lock:
+            self.sent[token] = (time.perf_counter(), worker)
+
+    def received(self, token, receiver, rec):
+        with self._lock:
+            sent = self.sent.get(token)
+            if sent is None or sent[1] == receiver[1]:
+                return
+            receiver[2].add(token)
+        rec.add('chat_cross_worker', time.perf_counter() - sent[0])
+
+    def missing(self):
+        with self._lock:
+            return sum(1 for token, (sent_at, worker) in self.sent.items()
+                       for connected_at, receiver, tokens in self.receivers
+                       if receiver != worker and connected_at < sent_at and token not in tokens)
+
+
+def use_mongomock():
+    import mongomock
+    import flask_pymongo
+
+    client = mongomock.MongoClient()
+
+    class MongomockPyMongo:
+        def __init__(self, app=None, uri=None, **kwargs):
+            self.cx = client
+            self.db = client[DATABASE]
+
+    flask_pymongo.PyMongo = MongomockPyMongo
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Import app.py with benchmark settings and serve it from a background
+# thread. Returns (base url, db).
+def start_server(args):
+    os.environ['MONGO_URI'] = args.mongo if args.mongo != 'mongomock' else f'mongodb://localhost/{DATABASE}'
+    os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    for rule in ('MESSAGE', 'HISTORY', 'VOICE', 'AUTH'):
+        os.environ.setdefault(f'RATE_LIMIT_{rule}', UNLIMITED_RATE)
+    if args.mongo == 'mongomock':
+        use_mongomock()
+    os.chdir(ROOT)
+    import app as codecord
+
+    port = free_port()
+    threading.Thread(target=codecord.socketio.run, args=(codecord.app,),
+                     kwargs={'host': '127.0.0.1', 'port': port, 'log_output': False,
+                             'use_reloader': False, 'allow_unsafe_werkzeug': True},
+                     daemon=True).start()
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            requests.get(f'{url}/login', timeout=1)
+            return url, codecord.mongo.db
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def connect_db(uri):
+    from pymongo import MongoClient
+    return MongoClient(uri).get_default_database()
+
+
+def seed(db, args):
+    from passwords import PasswordHasher
+
+    pwhash = PasswordHasher(method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+                            pool_size=0).hash(PASSWORD)
+    now = datetime.utcnow()
+    users = [{'username': f'bench-{i}', 'email': f'bench-{i}@example.com', 'password_hash': pwhash,
+              'role': 'admin' if i < args.admin_users else 'user', 'created_at': now}
+             for i in range(args.http_users + args.chat_clients + args.voice_clients)]
+    # Clear data left by an earlier run against the same database
+    db.users.delete_many({'username': {'$regex': '^bench-'}})
+    db.projects.delete_many({'author': {'$regex': '^bench-'}})
+    db.tickets.delete_many({'author': {'$regex': '^bench-'}})
+    db.users.insert_many(users)
+    if args.projects:
+        db.projects.insert_many([{'title': f'Project {i}', 'description': 'Benchmark project',
+                                  'category': f'category-{i % 8}', 'author': 'bench-0',
+                                  'views': 0, 'likes': 0, 'forks': 0, 'created_at': now}
+                                 for i in range(args.projects)])
+    if args.tickets:
+        db.tickets.insert_many([{'title': f'Ticket {i}', 'description': 'Benchmark ticket',
+                                 'priority': ('low', 'medium', 'high')[i % 3],
+                                 'status': ('open', 'in_progress', 'closed')[i % 3],
+                                 'author': 'bench-0', 'created_at': now}
+                                for i in range(args.tickets)])
+    return [u['username'] for u in users]
+
+
+def login(url, username, rec):
+    session = requests.Session()
+    start = time.perf_counter()
+    try:
+        r = session.post(f'{url}/login', data={'email': username, 'password': PASSWORD},
+                         allow_redirects=False, timeout=30)
+    except requests.RequestException:
+        rec.error('login', status='exception')
+        return None
+    if r.status_code != 302 or 'session' not in session.cookies:
+        rec.error('login', status=r.status_code)
+        return None
+    rec.add('login', time.perf_counter() - start, r.status_code)
+    return session
+
+
+def http_user(url, username, admin, rec, stop):
+    session = login(url, username, rec)
+    if session is None:
+        return
+    paths = [('projects', '/projects'), ('tickets', '/tickets')]
+    if admin:
+        paths.append(('admin_dashboard', '/admin/dashboard'))
+    i = 0
+    while not stop.is_set():
+        op, path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            r = session.get(f'{url}{path}', allow_redirects=False, timeout=30)
+        except requests.RequestException:
+            rec.error(op, status='exception')
+            continue
+        if r.status_code >= 400:
+            rec.error(op, status=r.status_code)
+        else:
+            rec.add(op, time.perf_counter() - start, r.status_code)
+
+
+def socket_client(url, username, rec):
+    session = login(url, username, rec)
+    if session is None:
+        return None
+    sio = socketio.Client(reconnection=False)
+    start = time.perf_counter()
+    try:
+        sio.connect(url, headers={'Cookie': f"session={session.cookies['session']}"},
+                    transports=['websocket'], wait_timeout=30)
+    except socketio.exceptions.ConnectionError:
+        rec.error('socket_connect')
+        return None
+    rec.add('socket_connect', time.perf_counter() - start)
+    return sio
+
+
+def chat_client(url, worker, username, rate, rec, cross, stop):
+    sio = socket_client(url, username, rec)
+    if sio is None:
+        return
+    receiver = cross.connected(worker)
+    pending = {}
+    lock = threading.Lock()
+
+    def received(data):
+        with lock:
+            sent = pending.pop(data.get('message'), None)
+        if sent is not None:
+            rec.add('chat_message', time.perf_counter() - sent)
+        else:
+            cross.received(data.get('message'), receiver, rec)
+
+    sio.on('message', received)
+    sio.on('messages', lambda frame: [received(data) for data in frame])
+    i = 0
+    while not stop.is_set():
+        token = f'{username}:{i}'
+        i += 1
+        with lock:
+            pending[token] = time.perf_counter()
+        cross.send(token, worker)
+        sio.emit('message', {'message': token})
+        stop.wait(1 / rate)
+    time.sleep(1)  # let in-flight broadcasts arrive
+    with lock:
+        rec.error('chat_message', len(pending))
+    sio.disconnect()
+
+
+def voice_client(url, username, room, rec, stop):
+    sio = socket_client(url, username, rec)
+    if sio is None:
+        return
+    while not stop.is_set():
+        for event in ('join_voice', 'leave_voice'):
+            start = time.perf_counter()
+            try:
+                sio.call(event, {'room': room}, timeout=10)
+            except socketio.exceptions.TimeoutError:
+                rec.error(event)
+                continue
+            rec.add(event, time.perf_counter() - start)
+    sio.disconnect()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo', default='mongomock',
+                        help="'mongomock' or a MongoDB URI with a database name")
+    parser.add_argument('--url', action='append',
+                        help='benchmark a running server instead of starting one; '
+                             'repeat for workers sharing a message queue')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--http-users', type=int, default=20)
+    parser.add_argument('--admin-users', type=int, default=2)
+    parser.add_argument('--chat-clients', type=int, default=20)
+    parser.add_argument('--message-rate', type=float, default=1.0, help='messages/s per chat client')
+    parser.add_argument('--voice-clients', type=int, default=10)
+    parser.add_argument('--voice-rooms', type=int, default=3)
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--tickets', type=int, default=200)
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='fail when an operation has a higher share of errors')
+    parser.add_argument('--output', help='also write the results to this file')
+    args = parser.parse_args()
+    args.admin_users = min(args.admin_users, args.http_users)
+
+    if args.url:
+        if args.mongo == 'mongomock':
+            parser.error('--url needs --mongo set to the URI of the server\'s database')
+        urls, db = [url.rstrip('/') for url in args.url], connect_db(args.mongo)
+    else:
+        url, db = start_server(args)
+        urls = [url]
+    usernames = seed(db, args)
+
+    rec = Recorder()
+    cross = CrossWorker()
+    stop = threading.Event()
+    http_names = usernames[:args.http_users]
+    chat_names = usernames[args.http_users:args.http_users + args.chat_clients]
+    voice_names = usernames[args.http_users + args.chat_clients:]
+    # Clients are spread round-robin over the workers
+    clients = (
+        [threading.Thread(target=http_user,
+                          args=(urls[i % len(urls)], name, i < args.admin_users, rec, stop))
+         for i, name in enumerate(http_names)] +
+        [threading.Thread(target=chat_client,
+                          args=(urls[i % len(urls)], i % len(urls), name, args.message_rate, rec, cross, stop))
+         for i, name in enumerate(chat_names)] +
+        [threading.Thread(target=voice_client,
+                          args=(urls[i % len(urls)], name, f'bench-voice-{i % args.voice_rooms}', rec, stop))
+         for i, name in enumerate(voice_names)]
+    )
+    start = time.perf_counter()
+    for client in clients:
+        client.daemon = True
+        client.start()
+    time.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.join(timeout=15)
+    missing = cross.missing()
+    if missing:
+        rec.error('chat_cross_worker', missing)
+
+    operations = rec.summary(elapsed)
+    failed = sorted(op for op, stats in operations.items()
+                    if stats['error_rate'] > args.max_error_rate)
+    results = {
+        'revision': git_revision(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'mongo': 'mongomock' if args.mongo == 'mongomock' else 'mongod',
+        'server': 'external' if args.url else 'in-process',
+        'workers': len(urls),
+        'duration': round(elapsed, 3),
+        'config': {k: v for k, v in vars(args).items() if k not in ('mongo', 'url', 'output')},
+        'operations': operations,
+        'failed_operations': failed,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(f"Error rate above {args.max_error_rate:.2%} for: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Login throughput under concurrent chat load.
+
+Runs N concurrent "logins" (password verifications) while a chat ticker
+expects to run every TICK_MS and records how late each tick is. With
+eventlet installed the script monkey-patches and runs green threads, as the
+production worker does; otherwise it uses OS threads.
+
+    python benchmarks/login_throughput.py [--logins 200] [--concurrency 20] [--pool-size 4]
+
+Prints one JSON object per mode (inline vs pooled) with logins/s and the
+p50/p95/p99/max chat tick lag in milliseconds.
+"""
+import argparse
+import json
+import os
+import sys
+
+try:
+    import eventlet
+    eventlet.monkey_patch()
+    GREEN = True
+except ImportError:
+    GREEN = False
+
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from passwords import PasswordHasher
+
+TICK_MS = 10
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def spawn(fn, *args):
+    if GREEN:
+        return eventlet.spawn(fn, *args)
+    thread = threading.Thread(target=fn, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def join(task):
+    return task.wait() if GREEN else task.join()
+
+
+def run(hasher, pwhash, logins, concurrency):
+    lags = []
+    done = threading.Event()
+
+    def chat_ticker():
+        interval = TICK_MS / 1000
+        expected = time.perf_counter() + interval
+        while not done.is_set():
+            time.sleep(interval)
+            now = time.perf_counter()
+            lags.append(max(0.0, now - expected) * 1000)
+            expected = now + interval
+
+    remaining = [logins]
+    lock = threading.Lock()
+
+    def login_worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            assert hasher.verify(pwhash, 'correct horse battery staple')
+
+    ticker = spawn(chat_ticker)
+    start = time.perf_counter()
+    join_all = [spawn(login_worker) for _ in range(concurrency)]
+    for task in join_all:
+        join(task)
+    elapsed = time.perf_counter() - start
+    done.set()
+    join(ticker)
+    return {
+        'logins': logins,
+        'seconds': round(elapsed, 3),
+        'logins_per_second': round(logins / elapsed, 1),
+        'chat_tick_lag_ms': {
+            'p50': round(percentile(lags, 50), 2),
+            'p95': round(percentile(lags, 95), 2),
+            'p99': round(percentile(lags, 99), 2),
+            'max': round(max(lags, default=0.0), 2),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--method', default=os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'))
+    args = parser.parse_args()
+
+    pwhash = PasswordHasher(method=args.method, pool_size=0).hash('correct horse battery staple')
+    for mode, pool_size in (('inline', 0), ('pooled', args.pool_size)):
+        result = run(PasswordHasher(method=args.method, pool_size=pool_size),
+                     pwhash, args.logins, args.concurrency)
+        result.update({'mode': mode, 'pool_size': pool_size, 'method': args.method, 'green': GREEN})
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+log = logging.getLogger(__name__)
+
+
+def fingerprint(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:12]
+
+
+# One-time deployment setup (indexes, admin user, ...) shared by every worker
+# and host. The first worker to claim `key` in the `bootstrap` collection
+# runs the tasks and records their results; the others only poll that
+# document until it is marked complete. A claim expires after `lease`
+# seconds, so a worker that dies mid-bootstrap is replaced by another; a
+# worker whose task fails releases its claim so the next attempt, by any
+# worker, can start at once.
+class Bootstrap:
+    def __init__(self, get_db, key, tasks, lease=300, retry=5):
+        self.get_db = get_db
+        self.key = key
+        self.tasks = tasks  # name -> fn(db) returning a JSON-able result
+        self.lease = lease
+        self.retry = retry
+        self.complete = False
+        self.results = None
+        self.error = None
+        self.seconds = None
+        self._task = None
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+
+    def _claim(self, db, now):
+        claim = {'claimed_by': self.owner, 'claimed_until': now + timedelta(seconds=self.lease)}
+        try:
+            db.bootstrap.insert_one(dict(claim, _id=self.key, completed_at=None))
+            return True
+        except DuplicateKeyError:
+            return db.bootstrap.find_one_and_update(
+                {'_id': self.key, 'completed_at': None, 'claimed_until': {'$lt': now}},
+                {'$set': claim}) is not None
+
+    def _release(self, db):
+        try:
+            db.bootstrap.delete_one({'_id': self.key, 'completed_at': None, 'claimed_by': self.owner})
+        except PyMongoError as e:
+            log.warning("Could not release bootstrap claim, it expires in %ss: %s", self.lease, e)
+
+    # Returns True once the key is complete, whichever worker completed it.
+    def run_once(self):
+        db = self.get_db()
+        doc = db.bootstrap.find_one({'_id': self.key})
+        if doc is None or doc.get('completed_at') is None:
+            if not self._claim(db, datetime.utcnow()):
+                return False
+            log.info("Running bootstrap", extra={'key': self.key})
+            try:
+                results = {name: task(db) for name, task in self.tasks.items()}
+            except Exception:
+                self._release(db)
+                raise
+            db.bootstrap.update_one({'_id': self.key},
+                                    {'$set': {'completed_at': datetime.utcnow(), 'results': results}})
+            doc = {'results': results}
+        self.results = doc.get('results') or {}
+        self.complete = True
+        return True
+
+    def run(self, sleep=time.sleep):
+        start = time.perf_counter()
+        while True:
+            try:
+                if self.run_once():
+                    break
+            except PyMongoError as e:
+                self.error = str(e)
+                log.warning("Bootstrap attempt failed: %s", e)
+            except Exception as e:
+                self.error = f'{type(e).__name__}: {e}'
+                log.exception("Bootstrap task failed")
+            sleep(self.retry)
+        self.error = None
+        self.seconds = time.perf_counter() - start
+        log.info("Bootstrap complete", extra={'key': self.key, 'seconds': round(self.seconds, 3)})
+
+    def start(self, socketio):
+        if self._task is None:
+            self._task = socketio.start_background_task(self.run, socketio.sleep)
+
+    def state(self):
+        return {'key': self.key, 'complete': self.complete, 'results': self.results,
+                'error': self.error, 'seconds': self.seconds}
@@ -0,0 +1,27 @@
+import os
+import zmq
+
+# Minimal ZeroMQ broker for running several Socket.IO workers locally
+# without Redis. Start it, then point every worker at it with
+#   SOCKETIO_MESSAGE_QUEUE=zmq+tcp://127.0.0.1:5555+5556
+# Workers push events to the first port and subscribe on the second.
+if __name__ == "__main__":
+    host = os.getenv('BROKER_HOST', '127.0.0.1')
+    pull_port = int(os.getenv('BROKER_PULL_PORT', 5555))
+    pub_port = int(os.getenv('BROKER_PUB_PORT', 5556))
+
+    context = zmq.Context()
+    receiver = context.socket(zmq.PULL)
+    receiver.bind(f"tcp://{host}:{pull_port}")
+    publisher = context.socket(zmq.PUB)
+    publisher.bind(f"tcp://{host}:{pub_port}")
+    print(f"Socket.IO broker listening on {pull_port} (push) / {pub_port} (sub)")
+    try:
+        while True:
+            publisher.send(receiver.recv())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.close()
+        publisher.close()
+        context.term()
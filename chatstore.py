@@ -0,0 +1,68 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from batching import BatchWriter
+from pagination import fetch_page
+
+# Keyset ordering for chat history; the compound index is prefixed by the
+# channel and matches the sort, so every page is a bounded index range scan
+# regardless of its depth.
+HISTORY_SORT = [('timestamp', DESCENDING), ('_id', DESCENDING)]
+HISTORY_INDEX = [('channel', ASCENDING)] + HISTORY_SORT
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Messages stored before channels existed have no channel field and belong
+# to the default channel.
+DEFAULT_CHANNEL = 'general'
+
+DUPLICATE_KEY = 11000
+
+
+def channel_room(channel):
+    return f'channel:{channel}'
+
+
+# Write-behind persistence for chat messages.
+# handle_message broadcasts first and hands the document to enqueue(); the
+# queued documents are flushed with insert_many in batches.
+class MessageWriter(BatchWriter):
+    name = 'message-writer'
+
+    def __init__(self, get_collection, **kwargs):
+        super().__init__(**kwargs)
+        self.get_collection = get_collection
+
+    # insert_many sets each document's _id before sending, so a retried
+    # batch carries the same ids: documents that made it the first time fail
+    # with duplicate key errors, which mean they are already stored.
+    def write_batch(self, batch):
+        try:
+            self.get_collection().insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get('code') != DUPLICATE_KEY for error in e.details.get('writeErrors', ())) \
+                    or e.details.get('writeConcernErrors'):
+                raise
+
+
+def history_query(channel=DEFAULT_CHANNEL):
+    return {'channel': {'$in': [channel, None]} if channel == DEFAULT_CHANNEL else channel}
+
+
+# Return one page of a channel's messages older than `before` (newest
+# first) and the cursor for the next page, or None at the start of history.
+def fetch_history(collection, channel=DEFAULT_CHANNEL, before=None, limit=HISTORY_PAGE_SIZE,
+                  max_time_ms=None):
+    return fetch_page(collection, history_query(channel),
+                      {'user': 1, 'message': 1, 'channel': 1, 'timestamp': 1},
+                      sort_field='timestamp', direction=DESCENDING, cursor=before,
+                      limit=limit, max_limit=HISTORY_MAX_PAGE_SIZE, max_time_ms=max_time_ms)
+
+
+def serialize_message(message):
+    return {
+        'id': str(message['_id']),
+        'user': message['user'],
+        'channel': message.get('channel') or DEFAULT_CHANNEL,
+        'message': message['message'],
+        'timestamp': message['timestamp'].strftime('%H:%M:%S')
+    }
@@ -0,0 +1,193 @@
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from batching import BatchWriter
+from chatstore import DUPLICATE_KEY
+
+# Bucket width and number of buckets retained for each granularity.
+GRANULARITIES = {
+    'minute': (60, 24 * 60),      # last 24 hours
+    'hour': (3600, 30 * 24),      # last 30 days
+    'day': (86400, 366),          # last year
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(ts):
+    return int((ts - _EPOCH).total_seconds())
+
+
+# Event counters aggregated into fixed-width time buckets, plus running
+# totals per kind. Each event is counted under the kind alone, per user, per
+# room and per user in a room, so every filtered series is a single lookup.
+# Queries cost O(buckets in range); memory is bounded by the retention above.
+# All-time totals are kept per kind only: a per-user or per-room total is
+# summed over the coarsest buckets, so it covers that retention window.
+class TimeBuckets:
+    def __init__(self, granularities=GRANULARITIES):
+        self.granularities = granularities
+        self._buckets = {name: OrderedDict() for name in granularities}
+        self._coarsest = max(granularities, key=lambda name: granularities[name][0])
+        self.totals = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(kind, user_id, room):
+        keys = [(kind,)]
+        if user_id is not None:
+            keys.append((kind, 'user', user_id))
+        if room is not None:
+            keys.append((kind, 'room', room))
+        if user_id is not None and room is not None:
+            keys.append((kind, 'user', user_id, 'room', room))
+        return keys
+
+    # The one key that counts exactly the events matching every filter given
+    @staticmethod
+    def _key(kind, user_id=None, room=None):
+        if user_id is not None and room is not None:
+            return (kind, 'user', user_id, 'room', room)
+        if user_id is not None:
+            return (kind, 'user', user_id)
+        if room is not None:
+            return (kind, 'room', room)
+        return (kind,)
+
+    def add(self, kind, timestamp, amount=1, user_id=None, room=None):
+        keys = self._keys(kind, user_id, room)
+        seconds = _seconds(timestamp)
+        with self._lock:
+            self.totals[kind] += amount
+            for name, (width, keep) in self.granularities.items():
+                buckets = self._buckets[name]
+                start = seconds - seconds % width
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = Counter()
+                    # Events arrive roughly in order; keep buckets sorted by
+                    # start so pruning drops the oldest first.
+                    if len(buckets) > 1 and next(reversed(buckets)) != start:
+                        self._buckets[name] = buckets = OrderedDict(sorted(buckets.items()))
+                    while len(buckets) > keep:
+                        buckets.popitem(last=False)
+                for key in keys:
+                    bucket[key] += amount
+
+    def total(self, kind, user_id=None, room=None):
+        key = self._key(kind, user_id, room)
+        with self._lock:
+            if len(key) == 1:
+                return self.totals[kind]
+            return sum(bucket[key] for bucket in self._buckets[self._coarsest].values())
+
+    # Return [(bucket start datetime, value)] for every bucket in [since, until).
+    def series(self, kind, granularity, since, until, user_id=None, room=None):
+        width = self.granularities[granularity][0]
+        key = self._key(kind, user_id, room)
+        start = _seconds(since)
+        start -= start % width
+        end = _seconds(until)
+        buckets = self._buckets[granularity]
+        with self._lock:
+            return [(datetime.utcfromtimestamp(t), buckets[t][key] if t in buckets else 0)
+                    for t in range(start, end, width)]
+
+
+def _rollup_id(granularity, start, key):
+    return ':'.join([granularity, str(start)] + [str(part) for part in key])
+
+
+# Descriptive fields of a rollup document. dim/key name the filter it
+# counts: None for the kind alone, e.g. 'user' and the user id for one
+# dimension, 'user+room' and [user id, room] for both.
+def _rollup_fields(granularity, start, key):
+    if len(key) == 1:
+        dim, value = None, None
+    elif len(key) == 3:
+        dim, value = key[1], key[2]
+    else:
+        dim, value = '+'.join(key[1::2]), list(key[2::2])
+    return {'granularity': granularity, 'start': datetime.utcfromtimestamp(start),
+            'kind': key[0], 'dim': dim, 'key': value}
+
+
+# Rollup documents remember the ids of the last ROLLUP_BATCH_IDS batches
+# applied to them; a retry only has to find its own batch among them
+ROLLUP_BATCH_IDS = 100
+
+
+# True when every error in a BulkWriteError is a duplicate key
+def _only_duplicates(e):
+    return not e.details.get('writeConcernErrors') and \
+        all(error.get('code') == DUPLICATE_KEY for error in e.details.get('writeErrors', ()))
+
+
+# Durable, cross-worker analytics. Events are queued in-process and written
+# in bulk to `analytics_events`; the same flush folds the batch into
+# pre-aggregated `analytics_rollups` documents (one $inc upsert per distinct
+# bucket/key in the batch), so every worker's events land in one summary.
+# Rollup reads use get_read_db when given, e.g. to read from secondaries.
+# Retrying a batch is safe: its events keep the _ids of the first attempt,
+# so stored ones are skipped, and each rollup upsert only matches a
+# document that has not recorded the batch's id. On one that has, the
+# upsert tries to insert its _id again and fails with a duplicate key,
+# which means the increment was already applied.
+class AnalyticsSink(BatchWriter):
+    name = 'analytics-sink'
+
+    def __init__(self, get_db, granularities=GRANULARITIES, get_read_db=None, **kwargs):
+        super().__init__(**kwargs)
+        self.get_db = get_db
+        self.get_read_db = get_read_db or get_db
+        self.granularities = granularities
+
+    def write_batch(self, batch):
+        for event in batch:
+            event.setdefault('_id', ObjectId())
+        batch_id = batch[0]['_id']
+        increments = Counter()
+        for event in batch:
+            seconds = _seconds(event['timestamp'])
+            for key in TimeBuckets._keys(event['kind'], event.get('user_id'), event.get('room')):
+                increments[('total', 0, key)] += event['amount']
+                for name, (width, keep) in self.granularities.items():
+                    increments[(name, seconds - seconds % width, key)] += event['amount']
+        db = self.get_db()
+        try:
+            db.analytics_events.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if not _only_duplicates(e):
+                raise
+        try:
+            db.analytics_rollups.bulk_write([
+                UpdateOne({'_id': _rollup_id(granularity, start, key), 'batches': {'$ne': batch_id}},
+                          {'$inc': {'value': amount},
+                           '$push': {'batches': {'$each': [batch_id], '$slice': -ROLLUP_BATCH_IDS}},
+                           '$setOnInsert': _rollup_fields(granularity, start, key)},
+                          upsert=True)
+                for (granularity, start, key), amount in increments.items()
+            ], ordered=False)
+        except BulkWriteError as e:
+            if not _only_duplicates(e):
+                raise
+
+    def total(self, kind, user_id=None, room=None):
+        key = TimeBuckets._key(kind, user_id, room)
+        doc = self.get_read_db().analytics_rollups.find_one({'_id': _rollup_id('total', 0, key)}, {'value': 1})
+        return doc['value'] if doc else 0
+
+    def series(self, kind, granularity, since, until, user_id=None, room=None):
+        width = self.granularities[granularity][0]
+        key = TimeBuckets._key(kind, user_id, room)
+        start = _seconds(since)
+        start -= start % width
+        end = _seconds(until)
+        ids = [_rollup_id(granularity, t, key) for t in range(start, end, width)]
+        found = {doc['_id']: doc['value'] for doc in
+                 self.get_read_db().analytics_rollups.find({'_id': {'$in': ids}}, {'value': 1})}
+        return [(datetime.utcfromtimestamp(t), found.get(_rollup_id(granularity, t, key), 0))
+                for t in range(start, end, width)]
@@ -0,0 +1,59 @@
+import logging
+import threading
+
+BROADCAST = None
+
+log = logging.getLogger(__name__)
+
+
+# Batched Socket.IO delivery. Outgoing payloads are collected per room and
+# sent every `window` seconds as one array frame on `event`, so
+# socket writes scale with windows rather than with messages. A room that
+# collects max_batch payloads is split into several frames.
+class FanoutBatcher:
+    def __init__(self, socketio, event='messages', window=0.03, max_batch=200):
+        self.socketio = socketio
+        self.event = event
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = {}
+        self.frames = 0
+        self.messages = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    def send(self, payload, room=BROADCAST):
+        with self._lock:
+            self.pending.setdefault(room, []).append(payload)
+        if self._task is None:
+            self._task = self.socketio.start_background_task(self._run)
+
+    # A frame that cannot be emitted (e.g. the message queue is unreachable)
+    # is logged and counted in `dropped`, not retried, so a broken queue
+    # cannot make pending grow without bound. Its messages are still
+    # persisted and come back with history.
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        dropped = 0
+        for room, payloads in pending.items():
+            for i in range(0, len(payloads), self.max_batch):
+                frame = payloads[i:i + self.max_batch]
+                try:
+                    self.socketio.emit(self.event, frame, to=room)
+                except Exception:
+                    log.exception("Failed to emit %d %r payloads to room %r", len(frame), self.event, room)
+                    dropped += len(frame)
+                    continue
+                self.frames += 1
+                self.messages += len(frame)
+        self.dropped += dropped
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Fan-out flush failed")
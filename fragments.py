@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import os
+from flask import render_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+
+def _id(doc):
+    return str(doc['_id'] if isinstance(doc, dict) else doc.id)
+
+
+# Digest of a document's fields: changes whenever anything a partial could
+# show changes, without every writer (including the admin models and edits
+# made outside the app) having to maintain a version field.
+def version_of(doc):
+    fields = doc if isinstance(doc, dict) else {k: v for k, v in vars(doc).items() if not k.startswith('_')}
+    return hashlib.sha1(repr(sorted(fields.items())).encode()).hexdigest()
+
+
+# Rendered per-row partials (project cards, ticket cards, user rows) keyed by
+# template, document id and version, plus `vary` for anything else the
+# partial reads (the viewer's role, values derived from the clock). A large
+# list re-renders only the rows that changed since it was last shown.
+# Templates call it as fragment(name, doc, vary=..., **context).
+class FragmentCache:
+    def __init__(self, maxsize=8192, ttl=600):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def init_app(self, app):
+        app.add_template_global(self.render, 'fragment')
+
+    def render(self, name, doc, vary=None, **context):
+        key = (name, _id(doc), version_of(doc), vary)
+        html = self.entries.get(key)
+        if html is None:
+            html = Markup(render_template(name, **context))
+            self.entries.set(key, html)
+        return html
+
+    @property
+    def hits(self):
+        return self.entries.hits
+
+    @property
+    def misses(self):
+        return self.entries.misses
+
+
+# Compiled templates are written to `directory` and reused by every worker
+# and restart until the template source changes.
+def init_bytecode_cache(app, directory):
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+# Load every template once, so the first request a worker serves does not
+# pay for parsing and compiling them. Returns the number loaded.
+def warm_templates(app):
+    loaded = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except Exception:
+            log.exception("Failed to compile template %s", name)
+    return loaded
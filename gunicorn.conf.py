@@ -0,0 +1,16 @@
+import os
+
+# Socket.IO needs an async worker; each worker multiplexes many greenlets.
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'eventlet')  # or 'gevent'
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+if workers > 1:
+    # Broadcasts must cross workers, and gunicorn does not do sticky
+    # sessions, so polling clients would bounce between workers.
+    if not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        raise RuntimeError('WEB_CONCURRENCY > 1 requires SOCKETIO_MESSAGE_QUEUE')
+    os.environ.setdefault('SOCKETIO_WEBSOCKET_ONLY', 'true')
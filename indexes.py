@@ -0,0 +1,135 @@
+import logging
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from chatstore import HISTORY_INDEX, HISTORY_SORT, DEFAULT_CHANNEL, history_query
+from pagination import encode_cursor, page_query, page_sort
+
+log = logging.getLogger(__name__)
+
+# Raw analytics events expire; the rollups keep the aggregates
+ANALYTICS_EVENT_TTL = 90 * 24 * 3600  # seconds
+
+# Indexes the app relies on, per collection: (keys, options). Listings sort
+# on (created_at, _id) (pagination.page_sort), so their indexes end in both
+# fields; without _id the server runs a blocking SORT over every match.
+INDEXES = {
+    'users': [
+        ([('username', ASCENDING)], {'name': 'username_unique', 'unique': True}),
+        ([('email', ASCENDING)], {'name': 'email_unique', 'unique': True}),
+        ([('role', ASCENDING)], {'name': 'role'}),
+        ([('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'created_at_id'}),
+    ],
+    'tickets': [
+        ([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'status_created_at_id'}),
+        ([('priority', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'priority_created_at_id'}),
+        ([('author', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'author_created_at_id'}),
+        ([('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'created_at_id'}),
+    ],
+    'projects': [
+        ([('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'category_created_at_id'}),
+        ([('author', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'author_created_at_id'}),
+        ([('created_at', DESCENDING), ('_id', DESCENDING)], {'name': 'created_at_id'}),
+    ],
+    'messages': [
+        (HISTORY_INDEX, {'name': 'channel_timestamp_id'}),
+    ],
+    'analytics_events': [
+        ([('timestamp', ASCENDING)], {'name': 'timestamp_ttl', 'expireAfterSeconds': ANALYTICS_EVENT_TTL}),
+    ],
+}
+
+# Indexes replaced by the ones above, dropped so writes stop maintaining them
+RETIRED_INDEXES = {
+    'users': ['created_at'],
+    'tickets': ['status_created_at', 'priority_created_at', 'author_created_at', 'created_at'],
+    'projects': ['category_created_at', 'author_created_at', 'created_at'],
+}
+
+# A cursor in the middle of a collection, to explain the keyset predicate
+# that every page after the first adds
+_CURSOR = {'created_at': datetime(2024, 1, 1), 'timestamp': datetime(2024, 1, 1),
+           '_id': ObjectId.from_datetime(datetime(2024, 1, 1))}
+
+
+def _later_page(query, sort_field):
+    return page_query(query, sort_field, DESCENDING, encode_cursor(_CURSOR, sort_field))
+
+
+# Hot queries that must be index-backed: (collection, filter, sort), built
+# with the same helpers as the queries the app runs.
+HOT_QUERIES = [
+    ('users', {'email': 'x'}, None),
+    ('users', {'username': 'x'}, None),
+    ('users', {'$or': [{'email': 'x'}, {'username': 'x'}]}, None),
+    ('users', {'role': 'admin'}, None),
+    ('users', {}, [('created_at', DESCENDING)]),
+    ('tickets', {'status': 'open'}, page_sort()),
+    ('tickets', {}, page_sort()),
+    ('tickets', _later_page({}, 'created_at'), page_sort()),
+    ('tickets', {'priority': 'high'}, page_sort()),
+    ('tickets', {'author': 'x'}, page_sort()),
+    ('projects', {}, page_sort()),
+    ('projects', _later_page({}, 'created_at'), page_sort()),
+    ('projects', {'category': 'x'}, page_sort()),
+    ('projects', {'author': 'x'}, page_sort()),
+    ('messages', history_query(DEFAULT_CHANNEL), HISTORY_SORT),
+    ('messages', _later_page(history_query(DEFAULT_CHANNEL), 'timestamp'), HISTORY_SORT),
+    ('messages', history_query('random'), HISTORY_SORT),
+    ('messages', _later_page(history_query('random'), 'timestamp'), HISTORY_SORT),
+]
+
+
+def ensure_indexes(db):
+    failures = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                failures.append((collection, options['name'], str(e)))
+                log.error('Could not create index %s.%s: %s', collection, options['name'], e)
+    for collection, names in RETIRED_INDEXES.items():
+        existing = set(db[collection].index_information())
+        for name in names:
+            if name in existing:
+                db[collection].drop_index(name)
+                log.info('Dropped retired index %s.%s', collection, name)
+    return failures
+
+
+def _plan_stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+# Stages that make a hot query's cost grow with the collection: a full scan,
+# or an in-memory sort of every match because no index provides the order
+SLOW_STAGES = ('COLLSCAN', 'SORT')
+
+
+# Run explain() on every hot query and return (collection, filter, sort,
+# stage) for each one whose winning plan contains a slow stage.
+def check_query_plans(db):
+    slow = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query).limit(5)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = set(_plan_stages(plan))
+        for stage in SLOW_STAGES:
+            if stage in stages:
+                slow.append((collection, query, sort, stage))
+                log.warning('%s on %s: filter=%s sort=%s', stage, collection, query, sort)
+    return slow
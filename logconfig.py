@@ -0,0 +1,104 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime
+
+REDACTED = '[redacted]'
+REDACT_KEYS = frozenset({'password', 'password_hash', 'new_password', 'secret', 'secret_key',
+                         'token', 'access_token', 'authorization', 'cookie', 'mongo_uri'})
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in REDACT_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(v) for v in value)
+    return value
+
+
+# Masks secrets in %-args and extra= fields before the record is formatted,
+# so a document or form passed to a log call never leaks its password hash.
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        if record.args:
+            record.args = redact(record.args)
+        for key in vars(record).keys() - _RECORD_FIELDS:
+            value = getattr(record, key)
+            setattr(record, key, REDACTED if key.lower() in REDACT_KEYS else redact(value))
+        return True
+
+
+# Keeps a random `rate` fraction of records at or below `level`; records
+# above it always pass.
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=1.0, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno > self.level or self.rate >= 1 or random.random() < self.rate
+
+
+# One JSON object per line: time, level, logger, message and extra= fields.
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in vars(record).keys() - _RECORD_FIELDS:
+            entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Records stay in-process, so they are queued as-is and the message is only
+# formatted by the listener. A full queue drops the record instead of
+# blocking the request that logged it.
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+# Route every logger through a QueueHandler: callers only filter and enqueue
+# the record, and a QueueListener thread does the formatting and stream
+# writes. Log calls below `level` return after a single level check.
+def setup_logging(level='INFO', fmt='json', sample_rate=1.0, queue_size=10000, stream=None):
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == 'json' else
+                         logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, _DroppingQueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,296 @@
+import bisect
+import threading
+import time
+from functools import wraps
+from flask import g, request
+from pymongo import monitoring
+from sockethooks import wrap_handlers
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Labelled values of one metric family for this process. Label values are
+# passed positionally in labelnames order.
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+# Counter or gauge read from fn() at scrape time, for values other objects
+# already keep; fn returns {label values tuple: value}.
+class Callback(_Metric):
+    def __init__(self, name, help, fn, labelnames=(), type='gauge'):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def samples(self):
+        for labels, value in self.fn().items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _labels(self.labelnames, labels, [('le', _number(bound))]), cumulative)
+            yield self.name + '_sum', _labels(self.labelnames, labels), total
+            yield self.name + '_count', _labels(self.labelnames, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def callback(self, name, help, fn, labelnames=(), type='gauge'):
+        return self._add(Callback(name, help, fn, labelnames, type))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    # Prometheus text exposition format, version 0.0.4
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Per-collection timings for every command the driver sends, from pymongo's
+# command monitoring events.
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self, registry):
+        self.duration = registry.histogram('mongo_command_duration_seconds',
+                                           'MongoDB command latency.', ('collection', 'command'))
+        self.failures = registry.counter('mongo_command_failures_total',
+                                         'MongoDB commands that failed.', ('collection', 'command'))
+        self._collections = {}
+
+    def started(self, event):
+        name = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = name if isinstance(name, str) else ''
+
+    def _collection(self, event):
+        return self._collections.pop((event.connection_id, event.request_id), '')
+
+    def succeeded(self, event):
+        self.duration.observe(event.duration_micros / 1e6, self._collection(event), event.command_name)
+
+    def failed(self, event):
+        collection = self._collection(event)
+        self.duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        self.failures.inc(collection, event.command_name)
+
+
+# Connection pool health per server: how long checkouts wait, how they end
+# (ok, timeout, connectionError, poolClosed) and how many connections are
+# open, checked out, or being waited for.
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    def __init__(self, registry):
+        self.wait = registry.histogram('mongo_pool_checkout_wait_seconds',
+                                       'Time to check a connection out of the pool.', ('address',))
+        self.checkouts = registry.counter('mongo_pool_checkouts_total',
+                                          'Connection checkouts by outcome.', ('address', 'outcome'))
+        self.connections = registry.gauge('mongo_pool_connections',
+                                          'Pool connections by state.', ('address', 'state'))
+
+    @staticmethod
+    def _address(event):
+        return '%s:%s' % event.address
+
+    def connection_check_out_started(self, event):
+        self.connections.inc(self._address(event), 'waiting')
+
+    def connection_checked_out(self, event):
+        address = self._address(event)
+        self.connections.dec(address, 'waiting')
+        self.connections.inc(address, 'in_use')
+        self.wait.observe(event.duration, address)
+        self.checkouts.inc(address, 'ok')
+
+    def connection_check_out_failed(self, event):
+        address = self._address(event)
+        self.connections.dec(address, 'waiting')
+        self.wait.observe(event.duration, address)
+        self.checkouts.inc(address, event.reason)
+
+    def connection_checked_in(self, event):
+        self.connections.dec(self._address(event), 'in_use')
+
+    def connection_created(self, event):
+        self.connections.inc(self._address(event), 'open')
+
+    def connection_closed(self, event):
+        self.connections.dec(self._address(event), 'open')
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+# Latency histograms, in-flight gauges and error counters for Flask routes
+# (labelled by endpoint, not path, so cardinality stays bounded) and for
+# Socket.IO handlers (labelled by event).
+class RequestMetrics:
+    def __init__(self, registry):
+        self.registry = registry
+        self.http_duration = registry.histogram('http_request_duration_seconds',
+                                                'HTTP request latency.', ('endpoint', 'method'))
+        self.http_requests = registry.counter('http_requests_total',
+                                              'HTTP requests by response status.',
+                                              ('endpoint', 'method', 'status'))
+        self.http_errors = registry.counter('http_request_errors_total',
+                                            'HTTP requests that raised or returned 5xx.',
+                                            ('endpoint', 'method'))
+        self.http_in_flight = registry.gauge('http_requests_in_flight',
+                                             'HTTP requests being handled.', ('endpoint',))
+        self.event_duration = registry.histogram('socketio_event_duration_seconds',
+                                                 'Socket.IO handler latency.', ('event',))
+        self.event_errors = registry.counter('socketio_event_errors_total',
+                                             'Socket.IO handlers that raised.', ('event',))
+        self.events_in_flight = registry.gauge('socketio_events_in_flight',
+                                               'Socket.IO handlers running.', ('event',))
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # Time every handler registered on the Socket.IO server from now on;
+    # Flask-SocketIO's retry of connect handlers without the auth argument
+    # is not counted as an error.
+    def init_socketio(self, socketio):
+        wrap_handlers(socketio, self.timed_event)
+
+    def timed_event(self, event, handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            self.events_in_flight.inc(event)
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                self.event_errors.inc(event)
+                raise
+            finally:
+                self.event_duration.observe(time.perf_counter() - start, event)
+                self.events_in_flight.dec(event)
+        return wrapper
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_endpoint = request.endpoint or 'unmatched'
+        self.http_in_flight.inc(g._metrics_endpoint)
+
+    def _after_request(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        endpoint = g.pop('_metrics_endpoint')
+        status = 500 if exc is not None else g.pop('_metrics_status', 500)
+        self.http_in_flight.dec(endpoint)
+        self.http_duration.observe(time.perf_counter() - start, endpoint, request.method)
+        self.http_requests.inc(endpoint, request.method, str(status))
+        if status >= 500:
+            self.http_errors.inc(endpoint, request.method)
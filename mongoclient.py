@@ -0,0 +1,36 @@
+import threading
+from flask_pymongo import PyMongo
+from flask_pymongo.helpers import BSONObjectIdConverter, BSONProvider
+
+
+# Flask-PyMongo with the MongoClient created on first use instead of at
+# import. pymongo resolves mongodb+srv:// URIs (DNS SRV and TXT lookups)
+# while building the client, so an eager client makes importing the app do
+# network I/O and raise ConfigurationError when the name does not resolve.
+# Here that error comes from the first query, which /readyz reports, and
+# creating the client is retried on the next use.
+class LazyPyMongo:
+    def __init__(self, app, **kwargs):
+        self.app = app
+        self.kwargs = kwargs
+        self._mongo = None
+        self._lock = threading.Lock()
+        # What PyMongo.init_app registers, so routes and JSON behave the
+        # same before and after the client exists
+        app.url_map.converters['ObjectId'] = BSONObjectIdConverter
+        app.json = BSONProvider(app)
+
+    def _client(self):
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    self._mongo = PyMongo(self.app, **self.kwargs)
+        return self._mongo
+
+    @property
+    def cx(self):
+        return self._client().cx
+
+    @property
+    def db(self):
+        return self._client().db
@@ -0,0 +1,53 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+
+# Opaque keyset cursor: "<sort value>_<_id>" of the last document on a page.
+def encode_cursor(doc, sort_field):
+    return f"{doc[sort_field].isoformat()}_{doc['_id']}"
+
+
+def decode_cursor(cursor):
+    try:
+        value, doc_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(value), ObjectId(doc_id)
+    except (ValueError, InvalidId):
+        raise ValueError(f"Invalid page cursor: {cursor!r}")
+
+
+# The filter for the documents of `query` that come after `cursor` in
+# (sort_field, _id) order.
+def page_query(query, sort_field='created_at', direction=DESCENDING, cursor=None):
+    if not cursor:
+        return query
+    value, doc_id = decode_cursor(cursor)
+    op = '$lt' if direction == DESCENDING else '$gt'
+    after = {'$or': [
+        {sort_field: {op: value}},
+        {sort_field: value, '_id': {op: doc_id}}
+    ]}
+    return {'$and': [query, after]} if query else after
+
+
+def page_sort(sort_field='created_at', direction=DESCENDING):
+    return [(sort_field, direction), ('_id', direction)]
+
+
+# Return one page of documents ordered by (sort_field, _id) that come after
+# `cursor`, and the cursor for the following page (None on the last page).
+# The range predicate on an index prefixed by sort_field keeps every page a
+# bounded index scan, so page N costs the same as page 1. max_time_ms bounds
+# the query on the server (ExecutionTimeout when exceeded).
+def fetch_page(collection, query, projection=None, sort_field='created_at',
+               direction=DESCENDING, cursor=None, limit=20, max_limit=100, max_time_ms=None):
+    limit = max(1, min(int(limit), max_limit))
+    found = (collection.find(page_query(query, sort_field, direction, cursor), projection)
+             .sort(page_sort(sort_field, direction))
+             .limit(limit + 1))
+    if max_time_ms:
+        found = found.max_time_ms(max_time_ms)
+    docs = list(found)
+    next_cursor = encode_cursor(docs[limit - 1], sort_field) if len(docs) > limit else None
+    return docs[:limit], next_cursor
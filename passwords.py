@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def _eventlet_patched():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+# Password hashing off the event loop. Hashing is CPU-bound, and hashlib
+# releases the GIL while it runs, so a small pool of real OS threads keeps
+# logins from stalling every greenlet on the worker. Under eventlet and
+# gevent the threading module is green, so work goes through eventlet's
+# tpool or the gevent hub's native threadpool instead.
+class PasswordHasher:
+    def __init__(self, method='scrypt:32768:8:1', salt_length=16, pool_size=4):
+        self.method = method
+        self.salt_length = salt_length
+        self.pool_size = pool_size
+        self._call = None
+        self._prefix = None
+
+    def _pool(self):
+        if _eventlet_patched():
+            from eventlet import tpool
+            tpool.set_num_threads(self.pool_size)
+            return tpool.execute
+        if _gevent_patched():
+            import gevent
+            threadpool = gevent.get_hub().threadpool
+            threadpool.maxsize = self.pool_size
+            return lambda fn, *args: threadpool.apply(fn, args)
+        executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='password-hasher')
+        return lambda fn, *args: executor.submit(fn, *args).result()
+
+    def _run(self, fn, *args):
+        if self.pool_size <= 0:
+            return fn(*args)
+        if self._call is None:
+            self._call = self._pool()
+        return self._call(fn, *args)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # True when the stored hash was made with other parameters than the
+    # configured ones, e.g. after raising the cost. werkzeug stores the
+    # method with its defaults filled in ('scrypt' is written as
+    # 'scrypt:32768:8:1'), so the expected prefix comes from a probe hash.
+    def needs_rehash(self, pwhash):
+        if self._prefix is None:
+            self._prefix = self.hash('').split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
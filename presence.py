@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+# Open voice sessions keyed by (user, room) with per-room and per-user
+# membership sets, so join/leave/lookups are O(1) and active-room stats never
+# walk session history. Closed-session durations are folded into running
+# totals.
+class VoicePresence:
+    def __init__(self):
+        self.sessions = {}
+        self.rooms = defaultdict(set)
+        self.user_rooms = defaultdict(set)
+        self.total_sessions = 0
+        self.total_duration = 0.0
+        self.user_duration = Counter()
+        self.room_duration = Counter()
+        self._lock = threading.Lock()
+
+    # Returns the new session, or None if the user is already in the room.
+    def join(self, user_id, room, now=None):
+        with self._lock:
+            key = (user_id, room)
+            if key in self.sessions:
+                return None
+            session = {
+                'user_id': user_id,
+                'room': room,
+                'start_time': now or datetime.utcnow(),
+                'end_time': None,
+                'duration': 0
+            }
+            self.sessions[key] = session
+            self.rooms[room].add(user_id)
+            self.user_rooms[user_id].add(room)
+            self.total_sessions += 1
+            return session
+
+    # Close the user's session in `room`, or all of their sessions when room
+    # is None. Returns the closed sessions.
+    def leave(self, user_id, room=None, now=None):
+        now = now or datetime.utcnow()
+        closed = []
+        with self._lock:
+            rooms = [room] if room is not None else list(self.user_rooms.get(user_id, ()))
+            for r in rooms:
+                session = self.sessions.pop((user_id, r), None)
+                if session is None:
+                    continue
+                session['end_time'] = now
+                session['duration'] = (now - session['start_time']).total_seconds()
+                self._discard(self.rooms, r, user_id)
+                self._discard(self.user_rooms, user_id, r)
+                self.total_duration += session['duration']
+                self.user_duration[user_id] += session['duration']
+                self.room_duration[r] += session['duration']
+                closed.append(session)
+        return closed
+
+    @staticmethod
+    def _discard(index, key, member):
+        members = index.get(key)
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del index[key]
+
+    def members(self, room):
+        return set(self.rooms.get(room, ()))
+
+    def active_rooms(self):
+        return len(self.rooms)
+
+    def is_in(self, user_id, room):
+        return (user_id, room) in self.sessions
+
+
+# Connected Socket.IO sessions per user for a single process. A user is
+# online while at least one of their sessions (tabs) has sent a heartbeat
+# within `ttl` seconds.
+class MemoryPresenceStore:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.sessions = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def _prune(self, user, now):
+        sids = self.sessions.get(user)
+        if sids is None:
+            return 0
+        for sid, seen in list(sids.items()):
+            if seen < now - self.ttl:
+                del sids[sid]
+        if not sids:
+            del self.sessions[user]
+            return 0
+        return len(sids)
+
+    # Returns True when this session brought the user online.
+    def add(self, user, sid, now):
+        with self._lock:
+            was_online = self._prune(user, now) > 0
+            self.sessions[user][sid] = now
+            return not was_online
+
+    def touch(self, user, sid, now):
+        return self.add(user, sid, now)
+
+    # Returns True when the user has no live sessions left.
+    def remove(self, user, sid, now):
+        with self._lock:
+            if user not in self.sessions:
+                return False
+            self.sessions[user].pop(sid, None)
+            return self._prune(user, now) == 0
+
+    # Drop expired sessions; returns the users that went offline.
+    def expire(self, now):
+        with self._lock:
+            return [user for user in list(self.sessions) if self._prune(user, now) == 0]
+
+    def online(self, now):
+        with self._lock:
+            return [user for user in list(self.sessions) if self._prune(user, now) > 0]
+
+
+# Same contract as MemoryPresenceStore, shared by every worker through
+# Redis: one sorted set of sid -> last heartbeat per user, plus a sorted set
+# of user -> last heartbeat used for the online list and expiry sweeps.
+class RedisPresenceStore:
+    def __init__(self, url, ttl=60, prefix='codecord:presence'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.users_key = f'{prefix}:users'
+
+    def _user_key(self, user):
+        return f'{self.prefix}:user:{user}'
+
+    def add(self, user, sid, now):
+        key = self._user_key(user)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now - self.ttl)
+        pipe.zcard(key)
+        pipe.zadd(key, {sid: now})
+        pipe.zadd(self.users_key, {user: now})
+        pipe.expire(key, self.ttl * 2)
+        live_before = pipe.execute()[1]
+        return live_before == 0
+
+    def touch(self, user, sid, now):
+        return self.add(user, sid, now)
+
+    def remove(self, user, sid, now):
+        key = self._user_key(user)
+        pipe = self.redis.pipeline()
+        pipe.zrem(key, sid)
+        pipe.zremrangebyscore(key, '-inf', now - self.ttl)
+        pipe.zcard(key)
+        if pipe.execute()[2] == 0:
+            return self.redis.zrem(self.users_key, user) > 0
+        return False
+
+    def expire(self, now):
+        offline = []
+        stale = self.redis.zrangebyscore(self.users_key, '-inf', now - self.ttl)
+        for user in stale:
+            user = user.decode()
+            key = self._user_key(user)
+            self.redis.zremrangebyscore(key, '-inf', now - self.ttl)
+            # Only the worker that actually removes the user reports it
+            if self.redis.zcard(key) == 0 and self.redis.zrem(self.users_key, user):
+                offline.append(user)
+        return offline
+
+    def online(self, now):
+        return [user.decode() for user in
+                self.redis.zrangebyscore(self.users_key, now - self.ttl, '+inf')]
+
+
+# Online-user tracking for chat. Transitions (first session connected, last
+# session gone or expired) are coalesced per user and broadcast at most once
+# per `interval` seconds as a single 'presence' delta {joined, left}, so a
+# burst of connects costs one frame per client per interval instead of a
+# full list per connect.
+class OnlinePresence:
+    def __init__(self, store, interval=1.0):
+        self.store = store
+        self.interval = interval
+        self.pending = {}
+        self.broadcasts = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    def _mark(self, user, state):
+        with self._lock:
+            previous = self.pending.get(user)
+            if previous is not None and previous != state:
+                # joined+left (or left+joined) within one window cancels out
+                del self.pending[user]
+            else:
+                self.pending[user] = state
+
+    def connect(self, user, sid):
+        if self.store.add(user, sid, time.time()):
+            self._mark(user, 'joined')
+
+    def heartbeat(self, user, sid):
+        if self.store.touch(user, sid, time.time()):
+            self._mark(user, 'joined')
+
+    def disconnect(self, user, sid):
+        if self.store.remove(user, sid, time.time()):
+            self._mark(user, 'left')
+
+    def users(self):
+        return sorted(self.store.online(time.time()))
+
+    def take_delta(self):
+        for user in self.store.expire(time.time()):
+            self._mark(user, 'left')
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return None
+        return {
+            'joined': sorted(u for u, state in pending.items() if state == 'joined'),
+            'left': sorted(u for u, state in pending.items() if state == 'left')
+        }
+
+    def start(self, socketio):
+        if self._task is None:
+            self._task = socketio.start_background_task(self._run, socketio)
+
+    # A failed sweep or broadcast (e.g. Redis unavailable) is logged and the
+    # loop carries on; an undelivered delta is merged back into pending and
+    # sent with the next one.
+    def _run(self, socketio):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                delta = self.take_delta()
+            except Exception:
+                log.exception("Presence sweep failed")
+                continue
+            if not delta:
+                continue
+            try:
+                socketio.emit('presence', delta)
+                self.broadcasts += 1
+            except Exception:
+                log.exception("Presence broadcast failed")
+                for state in ('joined', 'left'):
+                    for user in delta[state]:
+                        self._mark(user, state)
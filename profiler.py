@@ -0,0 +1,226 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import g, request
+from sockethooks import wrap_handlers
+
+
+# Under eventlet the threading and time modules are green; the stack sampler
+# must be a real OS thread so it keeps running while a greenlet hogs the CPU.
+def _real(module):
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return __import__(module)
+    return patcher.original(module)
+
+
+def _eventlet_patched():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+
+# Runtime profiler switched on by admins for a bounded time. While active:
+#   - a sampler thread records the stack of every other thread each
+#     `interval` seconds, kept as folded stacks ("root;...;leaf count") that
+#     flamegraph.pl, speedscope and similar tools read directly;
+#   - `sample_rate` of Flask requests and Socket.IO events run under
+#     cProfile, aggregated per route ("route:<endpoint>") and per event
+#     ("event:<name>").
+# Only one request or event is profiled at a time: a profiler observes the
+# whole thread, so concurrent requests would be attributed to the wrong key.
+# Under eventlet every greenlet shares the one OS thread, so a greenlet
+# switch tracer pauses the profile while its greenlet is switched out and
+# resumes it when the greenlet is switched back in; other greenlets' work
+# never lands in the profile. State is per worker process.
+class Profiler:
+    def __init__(self, max_duration=300, interval=0.01):
+        self.max_duration = max_duration
+        self.interval = interval
+        self.sample_rate = 0.0
+        self.until = 0.0
+        self.started_at = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.stats = {}
+        self.calls = Counter()
+        self._profile_lock = threading.Lock()
+        # Shared with the sampler's OS thread, so never a green lock
+        self._stats_lock = _real('threading').Lock()
+        self._sampler = None
+        self._previous_trace = None
+
+    @property
+    def active(self):
+        return time.monotonic() < self.until
+
+    # Start (or restart) a profiling session, discarding the previous one.
+    def start(self, duration=60, sample_rate=1.0, interval=None):
+        duration = min(max(float(duration), 1.0), self.max_duration)
+        self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if interval is not None:
+            self.interval = max(float(interval), 0.001)
+        with self._stats_lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.stats = {}
+            self.calls = Counter()
+        self.started_at = time.time()
+        self.until = time.monotonic() + duration
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = _real('threading').Thread(target=self._sample, name='profiler-sampler',
+                                                      daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        self.until = 0.0
+
+    def _sample(self):
+        sleep = _real('time').sleep
+        me = _real('threading').get_ident()
+        while self.active:
+            sleep(self.interval)
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(names)))
+            with self._stats_lock:
+                self.stacks.update(stacks)
+                self.samples += 1
+
+    def _begin(self):
+        if not self.active or random.random() >= self.sample_rate:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, coverage) owns the thread
+            self._profile_lock.release()
+            return None
+        if _eventlet_patched():
+            self._follow_greenlet(profile)
+        return profile
+
+    # Pause `profile` whenever the current greenlet switches out and resume
+    # it when it switches back in, chaining to any previous greenlet tracer.
+    def _follow_greenlet(self, profile):
+        import greenlet
+        current = greenlet.getcurrent()
+
+        def trace(event, args):
+            if event in ('switch', 'throw'):
+                origin, target = args
+                if origin is current:
+                    profile.disable()
+                elif target is current:
+                    try:
+                        profile.enable()
+                    except ValueError:
+                        pass
+            if previous is not None:
+                previous(event, args)
+
+        previous = greenlet.settrace(trace)
+        self._previous_trace = (previous,)
+
+    def _end(self, profile, key):
+        if self._previous_trace is not None:
+            import greenlet
+            greenlet.settrace(self._previous_trace[0])
+            self._previous_trace = None
+        profile.disable()
+        self._profile_lock.release()
+        with self._stats_lock:
+            if key in self.stats:
+                self.stats[key].add(profile)
+            else:
+                self.stats[key] = pstats.Stats(profile)
+            self.calls[key] += 1
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # Profile handlers registered on the Socket.IO server from now on
+    def init_socketio(self, socketio):
+        wrap_handlers(socketio, self.profiled_event)
+
+    def profiled_event(self, event, handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            profile = self._begin()
+            if profile is None:
+                return handler(*args, **kwargs)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self._end(profile, f'event:{event}')
+        return wrapper
+
+    def _before_request(self):
+        profile = self._begin()
+        if profile is not None:
+            g._profile = profile
+
+    def _teardown_request(self, exc):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            self._end(profile, f'route:{request.endpoint or "unmatched"}')
+
+    def status(self):
+        with self._stats_lock:
+            return {
+                'active': self.active,
+                'remaining': max(0.0, self.until - time.monotonic()),
+                'started_at': self.started_at,
+                'sample_rate': self.sample_rate,
+                'interval': self.interval,
+                'stack_samples': self.samples,
+                'profiles': dict(self.calls)
+            }
+
+    # Folded stacks, one "frame;frame;... count" line per distinct stack.
+    def folded_stacks(self):
+        with self._stats_lock:
+            stacks = list(self.stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks))
+
+    # Raw pstats data for `key` (load with pstats.Stats(path), snakeviz,
+    # or gprof2dot), or None if nothing was profiled under it.
+    def dump_stats(self, key):
+        with self._stats_lock:
+            stats = self.stats.get(key)
+            return marshal.dumps(stats.stats) if stats is not None else None
+
+    def report(self, key, limit=40, sort='cumulative'):
+        with self._stats_lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                return None
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+            return out.getvalue()
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import request
+from flask_login import current_user
+from flask_socketio import emit
+from cache import TTLCache
+
+
+# Token buckets in process memory. Buckets live in a bounded LRU whose TTL
+# is the time a bucket needs to refill completely, so evicting an idle bucket
+# never changes a decision and memory stays bounded under key churn.
+# take() spends one token from every (key, rate, burst) bucket, or from none
+# of them when any is empty.
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, rate, burst):
+        key = (rate, burst)
+        cache = self._caches.get(key)
+        if cache is None:
+            cache = self._caches[key] = TTLCache(maxsize=self.max_keys, ttl=burst / rate)
+        return cache
+
+    def take(self, buckets, now):
+        with self._lock:
+            refilled = []
+            for key, rate, burst in buckets:
+                cache = self._cache(rate, burst)
+                tokens, last = cache.get(key) or (burst, now)
+                refilled.append((cache, key, min(burst, tokens + (now - last) * rate)))
+            allowed = all(tokens >= 1 for _, _, tokens in refilled)
+            for cache, key, tokens in refilled:
+                cache.set(key, (tokens - 1 if allowed else tokens, now))
+            return allowed
+
+
+# Token buckets shared by every worker through Redis; each take is a single
+# atomic script call over all of its buckets and idle buckets expire on
+# their own.
+class RedisBucketStore:
+    SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local ts = tonumber(bucket[2]) or now
+    tokens[i] = math.min(burst, (tonumber(bucket[1]) or burst) + math.max(0, now - ts) * rate)
+    if tokens[i] < 1 then
+        allowed = 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', tokens[i] - allowed, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return allowed
+"""
+
+    def __init__(self, url, prefix='codecord:ratelimit'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.redis.register_script(self.SCRIPT)
+
+    def take(self, buckets, now):
+        keys = [f'{self.prefix}:{key}' for key, _, _ in buckets]
+        args = [now] + [value for _, rate, burst in buckets for value in (rate, burst)]
+        return bool(self._take(keys=keys, args=args))
+
+
+def client_ip(trusted_hops=0):
+    if trusted_hops:
+        forwarded = [a.strip() for a in request.headers.get('X-Forwarded-For', '').split(',') if a.strip()]
+        if len(forwarded) >= trusted_hops:
+            return forwarded[-trusted_hops]
+    return request.remote_addr
+
+
+# Named token-bucket rules applied per user and per client IP. For signed-in
+# users the IP bucket is ip_multiplier times larger, so users behind one NAT
+# are limited individually while the IP bucket still caps a single host.
+# Both buckets are checked before either is spent, so a request one of them
+# rejects costs nothing in the other. Events over the limit are dropped;
+# allowed/throttled counts are kept per rule.
+class RateLimiter:
+    def __init__(self, rules, store, trusted_hops=0, ip_multiplier=10):
+        self.rules = rules  # name -> (tokens per second, burst)
+        self.store = store
+        self.trusted_hops = trusted_hops
+        self.ip_multiplier = ip_multiplier
+        self.allowed = Counter()
+        self.throttled = Counter()
+
+    def allow(self, rule, keys, now=None):
+        rate, burst = self.rules[rule]
+        buckets = [(f'{rule}:{key}', rate * scale, burst * scale) for key, scale in keys]
+        if not self.store.take(buckets, time.time() if now is None else now):
+            self.throttled[rule] += 1
+            return False
+        self.allowed[rule] += 1
+        return True
+
+    def _keys(self):
+        ip = f'ip:{client_ip(self.trusted_hops)}'
+        if current_user.is_authenticated:
+            return [(f'user:{current_user.id}', 1), (ip, self.ip_multiplier)]
+        return [(ip, 1)]
+
+    # Socket.IO handler decorator: excess events are dropped and the sender
+    # is told which event was throttled.
+    def event(self, rule):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not self.allow(rule, self._keys()):
+                    emit('rate_limited', {'event': rule})
+                    return None
+                return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Route decorator limiting POSTs; on_limit() builds the 429 response.
+    def route(self, rule, on_limit):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if request.method == 'POST' and not self.allow(rule, self._keys()):
+                    return on_limit()
+                return f(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {rule: {'allowed': self.allowed[rule], 'throttled': self.throttled[rule]}
+                for rule in self.rules}
@@ -0,0 +1,74 @@
+import time
+from flask import g, has_request_context, session
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+
+MODES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# Session key holding the time until which this user's reads stay on the
+# primary after a write
+PIN_KEY = '_read_primary_until'
+
+
+# "nodeType:ANALYTICS,region:eu;region:eu" -> [{'nodeType': 'ANALYTICS',
+# 'region': 'eu'}, {'region': 'eu'}]; tag sets are tried in order.
+def parse_tag_sets(value):
+    tag_sets = []
+    for group in filter(None, (g.strip() for g in (value or '').split(';'))):
+        tag_sets.append(dict(pair.split(':', 1) for pair in group.split(',')))
+    return tag_sets or None
+
+
+def read_preference(mode, max_staleness=-1, tag_sets=None):
+    if mode not in MODES:
+        raise ValueError(f"Unknown read preference: {mode!r}")
+    if mode == 'primary':
+        return Primary()
+    return MODES[mode](tag_sets=tag_sets, max_staleness=max_staleness)
+
+
+# Read preference and read concern per call site. Each site ('projects',
+# 'dashboard', ...) names a profile ('primary', 'reporting', ...); sites
+# without an entry read from the primary. A user who just wrote is pinned to
+# the primary for `pin_seconds`, so they see their own write even when the
+# listing it redirects to is served by a lagging secondary.
+class ReadRouter:
+    def __init__(self, get_db, profiles, sites, pin_seconds=0):
+        self.get_db = get_db
+        self.profiles = profiles  # name -> (read preference, read concern)
+        self.sites = sites  # call site -> profile name
+        self.pin_seconds = pin_seconds
+
+    def _options(self, site):
+        profile = self.sites.get(site, 'primary')
+        if profile != 'primary' and has_request_context() and \
+                (g.get('_read_primary') or session.get(PIN_KEY, 0) > time.time()):
+            profile = 'primary'
+        read_preference, read_concern = self.profiles[profile]
+        return {'read_preference': read_preference, 'read_concern': read_concern}
+
+    def database(self, site):
+        return self.get_db().with_options(**self._options(site))
+
+    def collection(self, site, name):
+        return self.get_db()[name].with_options(**self._options(site))
+
+    def pin_primary(self):
+        if self.pin_seconds and has_request_context():
+            session[PIN_KEY] = time.time() + self.pin_seconds
+
+    # Send the rest of this request's reads to the primary
+    def read_primary(self):
+        if has_request_context():
+            g._read_primary = True
+
+    def describe(self):
+        return {site: {'profile': profile,
+                       'read_preference': self.profiles[profile][0].document,
+                       'read_concern': self.profiles[profile][1].document}
+                for site, profile in sorted(self.sites.items())}
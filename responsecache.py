@@ -0,0 +1,145 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from cache import TTLCache
+
+
+# Version counters per resource kind ('projects', 'tickets'), for one
+# process. A write bumps its kind; cached responses rendered under an older
+# version are not served again.
+class MemoryVersionStore:
+    def __init__(self):
+        self.versions = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, kinds):
+        with self._lock:
+            return tuple(self.versions[kind] for kind in kinds)
+
+    def bump(self, *kinds):
+        with self._lock:
+            for kind in kinds:
+                self.versions[kind] += 1
+
+
+# Same contract, shared by every worker through Redis, so a write on one
+# worker invalidates the responses cached by all of them.
+class RedisVersionStore:
+    def __init__(self, url, prefix='codecord:cache-version'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, kinds):
+        return tuple(int(v or 0) for v in self.redis.mget([f'{self.prefix}:{k}' for k in kinds]))
+
+    def bump(self, *kinds):
+        pipe = self.redis.pipeline()
+        for kind in kinds:
+            pipe.incr(f'{self.prefix}:{kind}')
+        pipe.execute()
+
+
+class _Entry:
+    __slots__ = ('version', 'body', 'mimetype', 'etag', 'last_modified')
+
+    def __init__(self, version, body, mimetype):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+# Rendered GET responses keyed by endpoint, view and query arguments and the
+# user's role, tagged with a strong ETag (hash of the body) and
+# Last-Modified. While the versions of the kinds a view depends on are
+# unchanged, hits, including 304s for a matching If-None-Match or
+# If-Modified-Since, are answered without calling the view. Entries also
+# expire after `ttl`, which bounds staleness when versions are per process.
+# A view that reads from lagging secondaries could render pre-write data
+# right after a bump and cache it under the new version; for `settle_seconds`
+# after this process first sees a new version (the secondaries' maximum
+# staleness), misses call read_primary() before rendering, so every entry
+# cached under a version includes the writes that bumped it.
+class ResponseCache:
+    def __init__(self, versions, maxsize=1024, ttl=60, settle_seconds=0, read_primary=None):
+        self.versions = versions
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.settle_seconds = settle_seconds
+        self.read_primary = read_primary
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.primary_fills = 0
+        self._seen = {}  # kinds -> (version, time first seen)
+        self._lock = threading.Lock()
+
+    def invalidate(self, *kinds):
+        self.versions.bump(*kinds)
+
+    def _settling(self, kinds, version):
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(kinds)
+            if seen is None or seen[0] != version:
+                seen = self._seen[kinds] = (version, now)
+        return now - seen[1] < self.settle_seconds
+
+    def _key(self, per_user):
+        role = current_user.role if current_user.is_authenticated else 'anonymous'
+        return (request.endpoint,
+                tuple(sorted((request.view_args or {}).items())),
+                tuple(sorted(request.args.items(multi=True))),
+                role,
+                current_user.get_id() if per_user else None)
+
+    def _respond(self, entry):
+        response = make_response(entry.body)
+        response.mimetype = entry.mimetype
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    # Cache a GET view whose output depends only on the given kinds and on
+    # the user's role. per_user=True adds the user id to the key, for pages
+    # that also show who is signed in (and their flash messages).
+    def cached(self, *kinds, per_user=False):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                # Pending flash messages are rendered into full pages once
+                if request.method != 'GET' or (per_user and session.get('_flashes')):
+                    return f(*args, **kwargs)
+                key = self._key(per_user)
+                version = self.versions.get(kinds)
+                entry = self.entries.get(key)
+                if entry is not None and entry.version == version:
+                    self.hits += 1
+                    return self._respond(entry)
+                self.misses += 1
+                if self.read_primary is not None and self._settling(kinds, version):
+                    self.primary_fills += 1
+                    self.read_primary()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = _Entry(version, response.get_data(), response.mimetype)
+                self.entries.set(key, entry)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified,
+                'primary_fills': self.primary_fills, 'entries': len(self.entries)}
@@ -0,0 +1,14 @@
+# Pass every handler registered on the Socket.IO server from now on through
+# wrap(event, handler), including the admin blueprint's. This wraps the
+# server-level handler that Flask-SocketIO registers, so its own retry of
+# connect handlers without the auth argument happens inside one wrapped
+# call. A wrapper installed later runs inside the earlier ones.
+def wrap_handlers(socketio, wrap):
+    server = socketio.server
+    register = server.on
+
+    def on(event, handler=None, namespace=None):
+        if handler is None:
+            return lambda handler: on(event, handler, namespace)
+        return register(event, wrap(event, handler), namespace=namespace)
+    server.on = on
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from pymongo import DESCENDING
+from pymongo.errors import PyMongoError
+
+log = logging.getLogger(__name__)
+
+RECENT_TICKET_FIELDS = {'title': 1, 'status': 1, 'created_at': 1}
+RECENT_USER_FIELDS = {'username': 1, 'role': 1, 'created_at': 1}
+
+
+# Dashboard counters kept up to date by the write handlers and reconciled
+# against Mongo at most max_age seconds after the last reconcile, so a read
+# is O(1) and never more than max_age behind writes made by other workers.
+# Reconcile queries are bounded by max_time_ms; if they time out the previous
+# values are served for another max_age.
+class DashboardStats:
+    def __init__(self, get_db, max_age=60, recent_limit=5, max_time_ms=None):
+        self.get_db = get_db
+        self.max_age = max_age
+        self.recent_limit = recent_limit
+        self.max_time_ms = max_time_ms
+        self.counters = {
+            'total_users': 0,
+            'total_tickets': 0,
+            'open_tickets': 0,
+            'total_projects': 0
+        }
+        self.recent = {'tickets': [], 'users': []}
+        self.reconciled_at = None
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+
+    def reconcile(self):
+        db = self.get_db()
+        opts = {'maxTimeMS': self.max_time_ms} if self.max_time_ms else {}
+        counters = {
+            'total_users': db.users.estimated_document_count(**opts),
+            'total_tickets': db.tickets.estimated_document_count(**opts),
+            'open_tickets': db.tickets.count_documents({'status': 'open'}, **opts),
+            'total_projects': db.projects.estimated_document_count(**opts)
+        }
+        recent = {
+            'tickets': list(db.tickets.find({}, RECENT_TICKET_FIELDS, max_time_ms=self.max_time_ms)
+                            .sort('created_at', DESCENDING).limit(self.recent_limit)),
+            'users': list(db.users.find({}, RECENT_USER_FIELDS, max_time_ms=self.max_time_ms)
+                          .sort('created_at', DESCENDING).limit(self.recent_limit))
+        }
+        with self._lock:
+            self.counters = counters
+            self.recent = recent
+            self.reconciled_at = time.monotonic()
+
+    def is_stale(self):
+        return self.reconciled_at is None or time.monotonic() - self.reconciled_at > self.max_age
+
+    def snapshot(self):
+        # Only one caller reconciles; concurrent readers get the cached values
+        # unless nothing has been loaded yet.
+        if self.is_stale():
+            if self._reconcile_lock.acquire(blocking=self.reconciled_at is None):
+                try:
+                    if self.is_stale():
+                        self.reconcile()
+                except PyMongoError as e:
+                    if self.reconciled_at is None or not e.timeout:
+                        raise
+                    log.warning("Dashboard reconcile timed out; serving previous counters")
+                    self.reconciled_at = time.monotonic()
+                finally:
+                    self._reconcile_lock.release()
+        with self._lock:
+            return dict(self.counters, recent_tickets=list(self.recent['tickets']),
+                        recent_users=list(self.recent['users']))
+
+    def incr(self, name, delta=1):
+        with self._lock:
+            self.counters[name] = max(0, self.counters[name] + delta)
+
+    def add_recent(self, kind, doc):
+        with self._lock:
+            items = [doc] + self.recent[kind]
+            self.recent[kind] = items[:self.recent_limit]
+
+    def remove_recent(self, kind, doc_id):
+        with self._lock:
+            items = [d for d in self.recent[kind] if str(d['_id']) != str(doc_id)]
+            if len(items) != len(self.recent[kind]):
+                # A shown item went away; refill the list on the next read.
+                self.reconciled_at = None
+            self.recent[kind] = items
+
+    # Write hooks
+    def user_created(self, user_data):
+        self.incr('total_users')
+        self.add_recent('users', {k: user_data.get(k) for k in ('_id', 'username', 'role', 'created_at')})
+
+    def user_deleted(self, user_id):
+        self.incr('total_users', -1)
+        self.remove_recent('users', user_id)
+
+    def ticket_created(self, ticket):
+        self.incr('total_tickets')
+        if ticket.get('status') == 'open':
+            self.incr('open_tickets')
+        self.add_recent('tickets', {k: ticket.get(k) for k in ('_id', 'title', 'status', 'created_at')})
+
+    def ticket_status_changed(self, ticket_id, old_status, new_status):
+        if old_status == new_status:
+            return
+        if old_status == 'open':
+            self.incr('open_tickets', -1)
+        if new_status == 'open':
+            self.incr('open_tickets')
+        with self._lock:
+            for ticket in self.recent['tickets']:
+                if str(ticket['_id']) == str(ticket_id):
+                    ticket['status'] = new_status
+
+    def ticket_deleted(self, ticket):
+        self.incr('total_tickets', -1)
+        if ticket.get('status') == 'open':
+            self.incr('open_tickets', -1)
+        self.remove_recent('tickets', ticket['_id'])
+
+    def project_created(self):
+        self.incr('total_projects')
+
+    def project_deleted(self):
+        self.incr('total_projects', -1)
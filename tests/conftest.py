@@ -0,0 +1,22 @@
+import os
+import sys
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# mongomock 4.3 predates the `sort` argument pymongo 4.9 passes for every
+# UpdateOne in bulk_write; accept it when it is unset
+try:
+    from mongomock.collection import BulkOperationBuilder
+except ImportError:
+    pass
+else:
+    _add_update = BulkOperationBuilder.add_update
+
+    def _add_update_without_sort(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError('mongomock does not support sorted bulk updates')
+        return _add_update(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = _add_update_without_sort
@@ -0,0 +1,85 @@
+import batching
+from batching import BatchWriter
+
+
+# Records every write_batch call and fails the first `fails` of them. Unless
+# `background` is set the worker thread never starts, so documents only
+# leave the queue through flush() and the tests control every write.
+class FakeWriter(BatchWriter):
+    def __init__(self, fails=0, background=False, **kwargs):
+        kwargs.setdefault('retry_delay', 0)
+        super().__init__(**kwargs)
+        self.fails = fails
+        self.background = background
+        self.calls = []
+
+    def start(self):
+        if self.background:
+            super().start()
+
+    def write_batch(self, batch):
+        self.calls.append(list(batch))
+        if len(self.calls) <= self.fails:
+            raise RuntimeError('write failed')
+
+
+def test_full_queue_flushes_synchronously_before_accepting_the_document():
+    writer = FakeWriter(batch_size=10, max_queue=2, put_timeout=0.01)
+    for doc in range(3):
+        writer.enqueue(doc)
+
+    assert writer.backpressured == 1
+    assert writer.calls == [[0, 1]]
+    assert writer.written == 2
+    assert writer.pending() == 1
+
+    writer.stop()
+    assert writer.calls == [[0, 1], [2]]
+    assert writer.written == 3
+
+
+def test_batch_written_after_retries_counts_as_written():
+    writer = FakeWriter(fails=2, max_attempts=3)
+    for doc in range(4):
+        writer.enqueue(doc)
+    writer.flush()
+
+    assert writer.calls == [[0, 1, 2, 3]] * 3
+    assert (writer.written, writer.retried, writer.failed) == (4, 2, 0)
+
+
+def test_batch_dropped_after_max_attempts_counts_as_failed():
+    writer = FakeWriter(fails=3, max_attempts=3)
+    for doc in range(4):
+        writer.enqueue(doc)
+    writer.flush()
+    assert (writer.written, writer.retried, writer.failed) == (0, 2, 4)
+
+    # The writer keeps going with the next batch
+    writer.enqueue(4)
+    writer.flush()
+    assert writer.calls[-1] == [4]
+    assert (writer.written, writer.retried, writer.failed) == (1, 2, 4)
+
+
+def test_retries_back_off_exponentially(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(batching.time, 'sleep', sleeps.append)
+    writer = FakeWriter(fails=3, max_attempts=4, retry_delay=0.5)
+    writer.enqueue('doc')
+    writer.flush()
+
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert writer.written == 1
+
+
+def test_background_writer_drains_the_queue_on_stop():
+    writer = FakeWriter(background=True, batch_size=2, flush_interval=0.01)
+    for doc in range(5):
+        writer.enqueue(doc)
+    writer.stop()
+
+    assert writer.pending() == 0
+    assert sorted(doc for batch in writer.calls for doc in batch) == list(range(5))
+    assert all(len(batch) <= 2 for batch in writer.calls)
+    assert writer.written == 5
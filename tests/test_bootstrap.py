@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from bootstrap import Bootstrap
+
+
+def worker(db, owner, tasks, lease=300):
+    bootstrap = Bootstrap(lambda: db, 'v1', tasks, lease=lease)
+    bootstrap.owner = owner
+    return bootstrap
+
+
+def counting_task(runs, result='done'):
+    def task(db):
+        runs.append(db)
+        return result
+    return task
+
+
+def test_first_claimer_runs_the_tasks_and_records_results():
+    db = mongomock.MongoClient().db
+    runs = []
+    first = worker(db, 'a', {'indexes': counting_task(runs)})
+
+    assert first.run_once()
+    assert len(runs) == 1
+    assert first.state()['results'] == {'indexes': 'done'}
+    doc = db.bootstrap.find_one({'_id': 'v1'})
+    assert doc['claimed_by'] == 'a'
+    assert doc['completed_at'] is not None
+
+
+def test_second_worker_polls_until_the_first_completes():
+    db = mongomock.MongoClient().db
+    runs = []
+    started = []
+
+    def slow_task(db):
+        # While the first worker is mid-bootstrap the second only polls
+        started.append(second.run_once())
+        return 'done'
+
+    first = worker(db, 'a', {'indexes': slow_task})
+    second = worker(db, 'b', {'indexes': counting_task(runs)})
+
+    assert first.run_once()
+    assert started == [False]
+    assert not second.complete
+    assert second.run_once()
+    assert runs == []
+    assert second.state()['results'] == {'indexes': 'done'}
+
+
+def test_expired_lease_is_taken_over():
+    db = mongomock.MongoClient().db
+    db.bootstrap.insert_one({'_id': 'v1', 'completed_at': None, 'claimed_by': 'dead',
+                             'claimed_until': datetime.utcnow() - timedelta(seconds=1)})
+    runs = []
+    survivor = worker(db, 'b', {'indexes': counting_task(runs)})
+
+    assert survivor.run_once()
+    assert len(runs) == 1
+    assert db.bootstrap.find_one({'_id': 'v1'})['claimed_by'] == 'b'
+
+
+def test_live_lease_is_not_taken_over():
+    db = mongomock.MongoClient().db
+    db.bootstrap.insert_one({'_id': 'v1', 'completed_at': None, 'claimed_by': 'busy',
+                             'claimed_until': datetime.utcnow() + timedelta(seconds=60)})
+    runs = []
+
+    assert not worker(db, 'b', {'indexes': counting_task(runs)}).run_once()
+    assert runs == []
+
+
+def test_failed_task_releases_the_claim_for_the_next_worker():
+    db = mongomock.MongoClient().db
+
+    def broken(db):
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        worker(db, 'a', {'indexes': broken}).run_once()
+    assert db.bootstrap.find_one({'_id': 'v1'}) is None
+
+    runs = []
+    assert worker(db, 'b', {'indexes': counting_task(runs)}).run_once()
+    assert len(runs) == 1
+
+
+def test_run_retries_a_failed_task_until_it_succeeds():
+    db = mongomock.MongoClient().db
+    attempts = []
+
+    def flaky(db):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError('boom')
+        return 'done'
+
+    bootstrap = worker(db, 'a', {'indexes': flaky})
+    sleeps = []
+    bootstrap.run(sleep=sleeps.append)
+
+    assert len(attempts) == 3
+    assert sleeps == [bootstrap.retry, bootstrap.retry]
+    assert bootstrap.state()['complete']
+    assert bootstrap.state()['error'] is None
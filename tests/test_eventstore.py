@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import Analytics
+from eventstore import AnalyticsSink, TimeBuckets
+
+NOW = datetime(2024, 5, 1, 12, 0, 30)
+
+
+def test_filters_select_matching_events():
+    counters = TimeBuckets()
+    counters.add('message', NOW, user_id='alice', room='general')
+    counters.add('message', NOW, user_id='alice', room='random')
+    counters.add('message', NOW, user_id='bob', room='general')
+
+    assert counters.total('message') == 3
+    assert counters.total('message', user_id='alice') == 2
+    assert counters.total('message', room='general') == 2
+    assert counters.total('message', user_id='alice', room='general') == 1
+    assert counters.total('message', user_id='bob', room='random') == 0
+
+
+def test_series_with_user_and_room():
+    counters = TimeBuckets()
+    counters.add('message', NOW, user_id='alice', room='general')
+    counters.add('message', NOW, user_id='alice', room='random')
+    counters.add('message', NOW + timedelta(minutes=1), user_id='alice', room='general')
+
+    series = counters.series('message', 'minute', NOW - timedelta(minutes=1), NOW + timedelta(minutes=2),
+                             user_id='alice', room='general')
+    assert [count for _, count in series] == [0, 1, 1, 0]
+    assert series[1][0] == datetime(2024, 5, 1, 12, 0)
+
+
+def test_totals_are_kept_per_kind_only():
+    counters = TimeBuckets()
+    for i in range(100):
+        counters.add('message', NOW, user_id=f'user{i}', room=f'room{i}')
+
+    assert set(counters.totals) == {'message'}
+    assert counters.total('message', user_id='user7') == 1
+
+
+def test_buckets_are_pruned_to_retention():
+    granularities = {'minute': (60, 3), 'day': (86400, 2)}
+    counters = TimeBuckets(granularities)
+    for i in range(10):
+        counters.add('action', NOW + timedelta(days=i), user_id='alice')
+
+    assert len(counters._buckets['minute']) == 3
+    assert len(counters._buckets['day']) == 2
+    assert counters.total('action') == 10
+    # Per-user totals cover the retained day buckets
+    assert counters.total('action', user_id='alice') == 2
+
+
+def test_analytics_voice_sessions_are_counted_per_room():
+    analytics = Analytics()
+    analytics.log_voice_join('alice', 'lounge')
+    analytics.log_voice_join('alice', 'lounge')
+    analytics.log_voice_join('bob', 'lounge')
+    analytics.log_voice_leave('alice')
+
+    assert analytics.total('voice_session') == 2
+    assert analytics.total('voice_session', user_id='alice', room='lounge') == 1
+    assert analytics.voice.members('lounge') == {'bob'}
+
+
+def test_analytics_stats_without_sink():
+    analytics = Analytics(buffer_size=2)
+    for action in ('login', 'connect', 'disconnect'):
+        analytics.log_user_action('alice', action, {})
+    analytics.log_chat_message('alice', 'hi', room='general')
+
+    assert [a['action'] for a in analytics.recent_actions()] == ['connect', 'disconnect']
+    assert analytics.total('action', user_id='alice') == 3
+    assert analytics.get_user_stats('alice') == {'messages': 1, 'voice_time': 0, 'downloads': 0}
+
+
+@pytest.fixture
+def db():
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient().codecord
+
+
+def test_sink_rollups_match_in_memory_counters(db):
+    sink = AnalyticsSink(lambda: db)
+    counters = TimeBuckets()
+    events = [('alice', 'general'), ('alice', 'random'), ('bob', 'general'), ('alice', 'general')]
+    for user_id, room in events:
+        counters.add('message', NOW, user_id=user_id, room=room)
+    sink.write_batch([{'kind': 'message', 'user_id': u, 'room': r, 'amount': 1, 'details': None,
+                       'timestamp': NOW} for u, r in events])
+
+    for user_id, room in [(None, None), ('alice', None), (None, 'general'), ('alice', 'general'),
+                          ('bob', 'random')]:
+        assert sink.total('message', user_id=user_id, room=room) == \
+            counters.total('message', user_id=user_id, room=room)
+        assert sink.series('message', 'hour', NOW - timedelta(hours=1), NOW + timedelta(hours=1),
+                           user_id=user_id, room=room) == \
+            counters.series('message', 'hour', NOW - timedelta(hours=1), NOW + timedelta(hours=1),
+                            user_id=user_id, room=room)
+    assert db.analytics_events.count_documents({}) == 4
+    combined = db.analytics_rollups.find_one({'granularity': 'total', 'dim': 'user+room'},
+                                             sort=[('value', -1)])
+    assert combined['key'] == ['alice', 'general'] and combined['value'] == 2
+
+
+def test_sink_retry_skips_stored_events(db):
+    sink = AnalyticsSink(lambda: db)
+    batch = [{'kind': 'download', 'user_id': 'alice', 'room': None, 'amount': 1, 'details': None,
+              'timestamp': NOW}]
+    db.analytics_events.insert_many(batch)
+
+    sink.write_batch(batch)
+
+    assert db.analytics_events.count_documents({}) == 1
+    assert sink.total('download', user_id='alice') == 1
+
+
+def test_sink_retry_applies_rollups_once(db):
+    sink = AnalyticsSink(lambda: db)
+    batch = [{'kind': 'message', 'user_id': 'alice', 'room': 'general', 'amount': 1, 'details': None,
+              'timestamp': NOW} for _ in range(3)]
+    other = [{'kind': 'message', 'user_id': 'bob', 'room': 'general', 'amount': 1, 'details': None,
+              'timestamp': NOW}]
+
+    sink.write_batch(batch)
+    sink.write_batch(other)
+    # A retry after the first attempt's rollups were (partly) applied
+    db.analytics_rollups.delete_one({'_id': 'total:0:message:room:general'})
+    sink.write_batch(batch)
+
+    assert sink.total('message') == 4
+    assert sink.total('message', user_id='alice', room='general') == 3
+    assert sink.total('message', room='general') == 3  # recreated from the retry only
+
+
+def test_analytics_reads_from_sink(db):
+    sink = AnalyticsSink(lambda: db)
+    analytics = Analytics(sink=sink)
+    analytics.log_chat_message('alice', 'hi', room='general')
+    analytics.log_chat_message('bob', 'hi', room='general')
+    sink.stop()
+
+    assert sink.written == 2
+    assert analytics.total('message', room='general') == 2
+    assert analytics.total('message', user_id='bob', room='general') == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from indexes import HOT_QUERIES, INDEXES, RETIRED_INDEXES, ensure_indexes
+
+
+def _provides_sort(keys, query, sort):
+    # Fields matched by equality may lead; the keys after them must follow
+    # the sort (or its reverse) field by field
+    backward = [(field, -direction) for field, direction in sort]
+    for lead in range(len(keys)):
+        if all(field in query for field, _ in keys[:lead]) and \
+                keys[lead:lead + len(sort)] in (list(sort), backward):
+            return True
+    return False
+
+
+@pytest.mark.parametrize('collection,query,sort',
+                         [q for q in HOT_QUERIES if q[2] and '$and' not in q[1] and '$or' not in q[1]])
+def test_every_sorted_hot_query_has_an_index_in_sort_order(collection, query, sort):
+    assert any(_provides_sort(keys, query, sort) for keys, _ in INDEXES[collection])
+
+
+def test_ensure_indexes_drops_retired_indexes():
+    mongomock = pytest.importorskip('mongomock')
+    db = mongomock.MongoClient().codecord
+    db.tickets.create_index([('status', 1), ('created_at', -1)], name='status_created_at')
+
+    assert ensure_indexes(db) == []
+
+    names = set(db.tickets.index_information())
+    assert 'status_created_at' not in names
+    assert {options['name'] for _, options in INDEXES['tickets']} <= names
+    assert not names & set(RETIRED_INDEXES['tickets'])
@@ -0,0 +1,54 @@
+import greenlet
+
+import profiler
+from profiler import Profiler
+
+
+def own_work():
+    return sum(range(1000))
+
+
+def other_work():
+    return sum(range(1000))
+
+
+def profiled_functions(prof, key):
+    return {name for _, _, name in prof.stats[key].stats}
+
+
+def test_profile_skips_greenlets_that_run_while_it_is_switched_out(monkeypatch):
+    monkeypatch.setattr(profiler, '_eventlet_patched', lambda: True)
+    prof = Profiler()
+    prof.start(duration=5)
+    try:
+        def request():
+            profile = prof._begin()
+            greenlet.greenlet(other_work).switch()
+            own_work()
+            prof._end(profile, 'route:test')
+
+        greenlet.greenlet(request).switch()
+    finally:
+        prof.stop()
+
+    functions = profiled_functions(prof, 'route:test')
+    assert 'own_work' in functions
+    assert 'other_work' not in functions
+    assert greenlet.gettrace() is None
+
+
+def test_profile_restores_the_previous_greenlet_tracer(monkeypatch):
+    monkeypatch.setattr(profiler, '_eventlet_patched', lambda: True)
+    events = []
+    greenlet.settrace(lambda event, args: events.append(event))
+    prof = Profiler()
+    prof.start(duration=5)
+    try:
+        profile = prof._begin()
+        greenlet.greenlet(other_work).switch()
+        prof._end(profile, 'route:test')
+        assert events
+        assert greenlet.gettrace() is not None
+    finally:
+        prof.stop()
+        greenlet.settrace(None)
@@ -0,0 +1,88 @@
+from flask import Flask
+from flask_login import LoginManager, UserMixin, login_user
+
+import cache
+from ratelimit import MemoryBucketStore, RateLimiter
+
+
+class User(UserMixin):
+    def __init__(self, id):
+        self.id = id
+
+
+def takes(store, buckets, now, attempts):
+    return [store.take(buckets, now) for _ in range(attempts)]
+
+
+def test_take_allows_a_burst_then_refills_at_rate():
+    store = MemoryBucketStore()
+    bucket = [('k', 2.0, 3)]
+    assert takes(store, bucket, 0.0, 4) == [True, True, True, False]
+    assert takes(store, bucket, 0.5, 2) == [True, False]
+    # Refill is capped at the burst however long the bucket was idle
+    assert takes(store, bucket, 100.0, 4) == [True, True, True, False]
+
+
+def test_take_spends_nothing_when_any_bucket_is_empty():
+    store = MemoryBucketStore()
+    assert store.take([('b', 1.0, 1)], 0.0)
+    assert not store.take([('a', 1.0, 2), ('b', 1.0, 1)], 0.0)
+    assert takes(store, [('a', 1.0, 2)], 0.0, 3) == [True, True, False]
+
+
+def test_ttl_eviction_never_changes_a_decision(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: clock[0])
+    store = MemoryBucketStore()
+    bucket = [('k', 1.0, 2)]
+    assert takes(store, bucket, 0.0, 3) == [True, True, False]
+
+    # Half refilled: still cached, one token back
+    clock[0] = 1.0
+    assert takes(store, bucket, 1.0, 2) == [True, False]
+
+    # Idle for the full refill time: evicted, and a new bucket is just as full
+    clock[0] = 3.5
+    assert 'k' not in store._cache(1.0, 2)
+    assert takes(store, bucket, 3.5, 3) == [True, True, False]
+
+
+def test_signed_in_users_share_an_ip_bucket_ten_times_larger():
+    limiter = RateLimiter({'message': (1.0, 2)}, MemoryBucketStore())
+    ip = ('ip:10.0.0.1', 10)
+    for user in range(10):
+        keys = [(f'user:{user}', 1), ip]
+        assert [limiter.allow('message', keys, now=0.0) for _ in range(3)] == [True, True, False]
+
+    # The shared IP bucket is spent; rejections leave the user's bucket full
+    late = [('user:late', 1), ip]
+    assert not limiter.allow('message', late, now=0.0)
+    assert not limiter.allow('message', late, now=0.0)
+    assert limiter.allow('message', late, now=0.1)
+    assert not limiter.allow('message', late, now=0.1)
+    assert limiter.allow('message', late, now=0.2)
+
+
+def test_keys_are_per_user_when_signed_in_and_per_ip_otherwise():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    LoginManager(app).user_loader(lambda user_id: None)
+    limiter = RateLimiter({}, MemoryBucketStore())
+    environ = {'REMOTE_ADDR': '10.0.0.1'}
+
+    with app.test_request_context(environ_base=environ):
+        assert limiter._keys() == [('ip:10.0.0.1', 1)]
+
+    with app.test_request_context(environ_base=environ):
+        login_user(User('u1'))
+        assert limiter._keys() == [('user:u1', 1), ('ip:10.0.0.1', 10)]
+
+
+def test_stats_count_decisions_per_rule():
+    limiter = RateLimiter({'message': (1.0, 1), 'auth': (1.0, 5)}, MemoryBucketStore())
+    keys = [('ip:10.0.0.1', 1)]
+    assert limiter.allow('message', keys, now=0.0)
+    assert not limiter.allow('message', keys, now=0.0)
+    assert not limiter.allow('message', keys, now=0.5)
+    assert limiter.stats() == {'message': {'allowed': 1, 'throttled': 2},
+                               'auth': {'allowed': 0, 'throttled': 0}}
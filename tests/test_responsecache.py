@@ -0,0 +1,66 @@
+from flask import Flask, g
+from flask_login import LoginManager
+
+from readrouting import ReadRouter
+from responsecache import MemoryVersionStore, ResponseCache
+
+
+def make_app(cache, router):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    LoginManager(app).user_loader(lambda user_id: None)
+    reads = []
+
+    @app.route('/projects')
+    @cache.cached('projects')
+    def projects():
+        reads.append(router._options('projects')['read_preference'])
+        return 'projects'
+
+    return app, reads
+
+
+def router():
+    return ReadRouter(lambda: None, {'primary': ('primary', None), 'reporting': ('secondary', None)},
+                      {'projects': 'reporting'})
+
+
+def test_fills_read_from_primary_while_a_new_version_settles():
+    read_router = router()
+    cache = ResponseCache(MemoryVersionStore(), settle_seconds=60, read_primary=read_router.read_primary)
+    app, reads = make_app(cache, read_router)
+    client = app.test_client()
+
+    client.get('/projects')
+    cache.invalidate('projects')
+    client.get('/projects')
+
+    assert reads == ['primary', 'primary']
+    assert cache.stats()['primary_fills'] == 2
+
+
+def test_fills_use_the_route_once_settled():
+    read_router = router()
+    cache = ResponseCache(MemoryVersionStore(), settle_seconds=0, read_primary=read_router.read_primary)
+    app, reads = make_app(cache, read_router)
+    client = app.test_client()
+
+    client.get('/projects')
+    cache.invalidate('projects')
+    client.get('/projects')
+    client.get('/projects')
+
+    assert reads == ['secondary', 'secondary']
+    assert cache.stats()['hits'] == 1
+
+
+def test_read_primary_lasts_one_request():
+    read_router = router()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    with app.test_request_context():
+        read_router.read_primary()
+        assert g._read_primary
+        assert read_router._options('projects')['read_preference'] == 'primary'
+    with app.test_request_context():
+        assert read_router._options('projects')['read_preference'] == 'secondary'